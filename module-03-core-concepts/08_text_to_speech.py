@@ -3,6 +3,13 @@
 """
 
 import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
 from pathlib import Path
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -11,7 +18,125 @@ load_dotenv()
 client = OpenAI()
 
 
-def generate_speech(text, voice="alloy", model="tts-1", output_file="speech.mp3"):
+class TTSAudioCache:
+    """Content-addressed on-disk cache for synthesised speech
+
+    Audio is stored under a SHA-256 of (normalised text, voice, model, format),
+    so identical phrases are only ever synthesised once. The cache is bounded
+    by total size on disk and evicts least recently used files first. File
+    modification times record recency, so LRU order survives restarts.
+    """
+
+    def __init__(self, cache_dir=".tts_cache", max_bytes=100 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU index from the files already on disk"""
+        files = [p for p in self.cache_dir.iterdir() if p.is_file() and not p.name.startswith(".")]
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def normalize_text(text):
+        """Canonicalise text so trivially different inputs share an entry"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def make_key(self, text, voice, model, response_format="mp3"):
+        """Build the content address for a synthesis request"""
+        payload = json.dumps([self.normalize_text(text), voice, model, response_format])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text, voice, model, response_format="mp3"):
+        """Return the cached audio path, or None on a miss"""
+        key = self.make_key(text, voice, model, response_format)
+        path = self.cache_dir / f"{key}.{response_format}"
+
+        with self._lock:
+            if path not in self._entries or not path.exists():
+                self._entries.pop(path, None)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(path)
+            self.hits += 1
+
+        os.utime(path)  # Persist recency for the next process
+        return path
+
+    def put(self, text, voice, model, audio_bytes, response_format="mp3"):
+        """Store synthesised audio and evict old entries if over budget"""
+        key = self.make_key(text, voice, model, response_format)
+        path = self.cache_dir / f"{key}.{response_format}"
+
+        # Write to a temp file first so readers never see partial audio
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio_bytes)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = len(audio_bytes)
+            self._total_bytes += len(audio_bytes)
+            self._evict()
+
+        return path
+
+    def _evict(self):
+        """Drop least recently used files until under the size budget"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def synthesize(self, text, voice="alloy", model="tts-1", response_format="mp3"):
+        """Return a path to audio for text, calling the API only on a miss"""
+        cached = self.get(text, voice, model, response_format)
+        if cached:
+            return cached
+
+        response = client.audio.speech.create(
+            model=model,
+            voice=voice,
+            input=text,
+            response_format=response_format
+        )
+        return self.put(text, voice, model, response.content, response_format)
+
+    def stats(self):
+        """Get cache hit/miss metrics"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes
+        }
+
+
+tts_cache = TTSAudioCache()
+
+
+def generate_speech(text, voice="alloy", model="tts-1", output_file="speech.mp3", use_cache=True):
     """Generate speech from text"""
     print("\n" + "="*60)
     print("GENERATING SPEECH")
@@ -19,15 +144,22 @@ def generate_speech(text, voice="alloy", model="tts-1", output_file="speech.mp3"
     print(f"Text: {text[:100]}...")
     print(f"Voice: {voice}, Model: {model}\n")
 
-    response = client.audio.speech.create(
-        model=model,  # "tts-1" or "tts-1-hd"
-        voice=voice,   # alloy, echo, fable, onyx, nova, shimmer
-        input=text
-    )
-
-    # Save to file
     speech_file_path = Path(output_file)
-    response.stream_to_file(speech_file_path)
+
+    if use_cache:
+        # Repeated phrases are served from disk with no API call
+        response_format = speech_file_path.suffix.lstrip(".") or "mp3"
+        cached_path = tts_cache.synthesize(text, voice=voice, model=model, response_format=response_format)
+        shutil.copyfile(cached_path, speech_file_path)
+    else:
+        response = client.audio.speech.create(
+            model=model,  # "tts-1" or "tts-1-hd"
+            voice=voice,   # alloy, echo, fable, onyx, nova, shimmer
+            input=text
+        )
+
+        # Save to file
+        response.stream_to_file(speech_file_path)
 
     print(f"Speech saved to: {speech_file_path}")
     return speech_file_path
@@ -46,6 +178,8 @@ def demonstrate_voices():
         output_file = f"voice_sample_{voice}.mp3"
         generate_speech(text, voice=voice, output_file=output_file)
 
+    print(f"\nTTS cache: {tts_cache.stats()}")
+
 
 def main():
     print("Text-to-Speech Generation")
@@ -57,6 +191,10 @@ def main():
     # Example 2: HD quality
     generate_speech(sample_text, voice="nova", model="tts-1-hd", output_file="speech_hd.mp3")
 
+    # Example 3: Same phrase again - served from the audio cache
+    generate_speech(sample_text, voice="nova", model="tts-1", output_file="speech_cached.mp3")
+    print(f"TTS cache: {tts_cache.stats()}")
+
     print("\n" + "="*60)
     print("TTS FEATURES AND BEST PRACTICES")
     print("="*60)
@@ -79,6 +217,7 @@ Best Practices:
 3. Use tts-1-hd for content where quality matters
 4. Break long text into smaller chunks
 5. Test different voices to find the best fit
+6. Cache audio for repeated phrases (greetings, confirmations)
 
 Supported input: Up to 4096 characters per request
 Output format: MP3 by default
@@ -3,14 +3,287 @@
 """
 
 import os
+import re
 import json
+import time
+from functools import lru_cache
+from typing import List
 from dotenv import load_dotenv
 from openai import OpenAI
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 load_dotenv()
 client = OpenAI()
 
 
+# --- Compiled schema validation ---
+
+_JSON_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def compile_schema(schema, defs=None):
+    """
+    Compile a JSON schema into a validator function.
+
+    The schema is walked once up front and turned into nested closures, so
+    validating a response is just a handful of function calls instead of
+    re-interpreting the schema dict every time. Supports the subset used by
+    Structured Outputs: type, properties, required, additionalProperties,
+    items, enum, anyOf and local $ref.
+
+    The returned function takes a value and returns a list of error strings.
+    """
+    defs = defs if defs is not None else schema.get("$defs", {})
+
+    if "$ref" in schema:
+        ref_name = schema["$ref"].rsplit("/", 1)[-1]
+        resolved = {}
+
+        # Resolve lazily so recursive models do not loop forever
+        def check_ref(value, path="$"):
+            if "validator" not in resolved:
+                resolved["validator"] = compile_schema(defs[ref_name], defs)
+            return resolved["validator"](value, path)
+        return check_ref
+
+    checks = []
+
+    if "anyOf" in schema:
+        options = [compile_schema(option, defs) for option in schema["anyOf"]]
+
+        def check_any_of(value, path):
+            if any(not option(value, path) for option in options):
+                return []
+            return [f"{path}: does not match any allowed schema"]
+        checks.append(check_any_of)
+
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        type_checks = [_JSON_TYPES[t] for t in types]
+
+        def check_type(value, path):
+            if any(is_type(value) for is_type in type_checks):
+                return []
+            return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path):
+            return [] if value in allowed else [f"{path}: {value!r} not in {allowed}"]
+        checks.append(check_enum)
+
+    if "properties" in schema or "required" in schema:
+        properties = {
+            name: compile_schema(subschema, defs)
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        required = schema.get("required", [])
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return []  # Reported by the type check
+            errors = [f"{path}: missing required field '{name}'" for name in required if name not in value]
+            for name, item in value.items():
+                if name in properties:
+                    errors.extend(properties[name](item, f"{path}.{name}"))
+                elif closed:
+                    errors.append(f"{path}: unexpected field '{name}'")
+            return errors
+        checks.append(check_object)
+
+    if "items" in schema:
+        check_item = compile_schema(schema["items"], defs)
+
+        def check_items(value, path):
+            if not isinstance(value, list):
+                return []
+            errors = []
+            for i, item in enumerate(value):
+                errors.extend(check_item(item, f"{path}[{i}]"))
+            return errors
+        checks.append(check_items)
+
+    def validate(value, path="$"):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+        return errors
+
+    return validate
+
+
+def repair_json(text):
+    """
+    Best-effort repair of near-valid JSON from a model response.
+
+    Handles the usual failure modes - markdown code fences, leading chatter,
+    trailing commas and output truncated mid-object - locally, which is far
+    cheaper than re-calling the API. Raises json.JSONDecodeError if the text
+    still cannot be parsed.
+    """
+    text = text.strip()
+
+    # Strip ```json fences and anything before the first brace/bracket
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if starts:
+        text = text[min(starts):]
+
+    # One string-aware pass: drop commas before a closer and remember, for each
+    # open object, where a dangling key would have to be cut if the text ends
+    out = []
+    stack = []          # [closer, phase, cut] per open container
+    in_string = False
+    escaped = False
+
+    def drop_trailing_comma():
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            out.append(char)
+            continue
+
+        top = stack[-1] if stack else None
+        if top and top[1] == "colon" and not char.isspace():
+            top[1], top[2] = "value", None      # The pending key now has a value
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(["}", "key", len(out) + 1] if char == "{" else ["]", None, None])
+        elif char in "}]":
+            drop_trailing_comma()
+            if stack:
+                stack.pop()
+        elif char == "," and top and top[0] == "}":
+            top[1], top[2] = "key", len(out)
+        elif char == ":" and top and top[0] == "}":
+            top[1] = "colon"
+        out.append(char)
+
+    # Close the output where it was truncated
+    if in_string:
+        out.append('"')
+    if stack and stack[-1][2] is not None:
+        del out[stack[-1][2]:]      # Key or key-colon without a value
+    drop_trailing_comma()
+    text = "".join(out) + "".join(closer for closer, _, _ in reversed(stack))
+
+    return json.loads(text)
+
+
+class StructuredOutputSchema:
+    """
+    A JSON schema compiled once and reused for every request.
+
+    When the schema comes from a Pydantic model, responses are validated by
+    a cached TypeAdapter (Pydantic's Rust validator parses and checks in one
+    pass) and parse() returns model instances. Hand-written dict schemas
+    fall back to the closures from compile_schema() and parse() returns dicts.
+    """
+
+    def __init__(self, name, schema, strict=True, model=None):
+        self.name = name
+        self.schema = schema
+        self.adapter = TypeAdapter(model) if model is not None else None
+        self.validator = compile_schema(schema) if model is None else None
+        # Built once - this dict is sent as-is on every request
+        self.response_format = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": name,
+                "schema": schema,
+                "strict": strict
+            }
+        }
+
+    def validate(self, data):
+        """Return a list of validation errors (empty when valid)"""
+        if self.adapter is None:
+            return self.validator(data)
+        try:
+            self.adapter.validate_python(data, strict=True)
+        except ValidationError as e:
+            return [f"$.{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+        return []
+
+    def parse(self, content, repair=True):
+        """Parse and validate a response, repairing near-valid JSON locally"""
+        if self.adapter is not None:
+            try:
+                return self.adapter.validate_json(content, strict=True)
+            except ValidationError as e:
+                # Only malformed JSON is worth repairing; a schema mismatch stays an error
+                if not repair or any(error["type"] != "json_invalid" for error in e.errors()):
+                    raise
+            return self.adapter.validate_python(repair_json(content), strict=True)
+
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            if not repair:
+                raise
+            data = repair_json(content)
+
+        errors = self.validate(data)
+        if errors:
+            raise ValueError(f"Response does not match '{self.name}': {'; '.join(errors)}")
+        return data
+
+
+def _to_strict_schema(schema):
+    """Apply Structured Outputs strict-mode rules to a Pydantic JSON schema"""
+    if isinstance(schema, dict):
+        schema = {key: _to_strict_schema(value) for key, value in schema.items()}
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["required"] = list(schema["properties"])
+            schema["additionalProperties"] = False
+        return schema
+    if isinstance(schema, list):
+        return [_to_strict_schema(item) for item in schema]
+    return schema
+
+
+@lru_cache(maxsize=None)
+def schema_for_model(model_cls):
+    """Get the compiled schema and validator for a Pydantic model (built once per class)"""
+    schema = _to_strict_schema(model_cls.model_json_schema())
+    return StructuredOutputSchema(model_cls.__name__, schema, model=model_cls)
+
+
+# Schema for a Calendar Event (example) - compiled once at import time
+EVENT_SCHEMA = StructuredOutputSchema("event_schema", {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "time": {"type": "string"},
+        "attendees": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["title", "time", "attendees"],
+    "additionalProperties": False
+})
+
+
 def generate_json_mode(prompt):
     """Generate JSON using JSON mode"""
     print("\n" + "="*60)
@@ -34,15 +307,21 @@ def generate_json_mode(prompt):
 
     content = response.choices[0].message.content
     print(content)
-    
+
     # Parse to verify validity
     try:
         data = json.loads(content)
         print("\nValid JSON parsed successfully!")
         return data
-    except params:
-        print("\nError parsing JSON")
-        return None
+    except json.JSONDecodeError:
+        # Try a local repair before giving up (no extra API call)
+        try:
+            data = repair_json(content)
+            print("\nRepaired near-valid JSON locally")
+            return data
+        except json.JSONDecodeError:
+            print("\nError parsing JSON")
+            return None
 
 
 def generate_structured_output_cfg(prompt):
@@ -50,17 +329,6 @@ def generate_structured_output_cfg(prompt):
     print("\n" + "="*60)
     print("STRUCTURED OUTPUT (CFG)")
     print("="*60)
-    
-    # Schema for a Calendar Event (example)
-    schema = {
-        "type": "object",
-        "properties": {
-            "title": {"type": "string"},
-            "time": {"type": "string"},
-            "attendees": {"type": "array", "items": {"type": "string"}}
-        },
-        "required": ["title", "time"]
-    }
 
     # In 2026, this might be handled via a 'response_schema' or similar advanced param
     # For now, we simulate the standard function calling or json schema approach
@@ -70,17 +338,58 @@ def generate_structured_output_cfg(prompt):
             {"role": "system", "content": "Extract event details."},
             {"role": "user", "content": prompt}
         ],
-        response_format={
-            "type": "json_schema", 
-            "json_schema": {
-                "name": "event_schema",
-                "schema": schema,
-                "strict": True
-            }
-        }
+        response_format=EVENT_SCHEMA.response_format
     )
-    
-    print(response.choices[0].message.content)
+
+    content = response.choices[0].message.content
+    print(content)
+    return EVENT_SCHEMA.parse(content)
+
+
+class CalendarEvent(BaseModel):
+    """Pydantic version of the event schema"""
+    title: str
+    time: str
+    attendees: List[str]
+
+
+def benchmark_structured_overhead(iterations=10000):
+    """Microbenchmark: per-call schema/validation overhead, cached vs rebuilt"""
+    print("\n" + "="*60)
+    print("STRUCTURED OUTPUT OVERHEAD (no API calls)")
+    print("="*60)
+
+    sample = '{"title": "Team sync", "time": "2 PM", "attendees": ["Alice", "Bob"]}'
+
+    def per_call_us(func):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    results = {
+        "Rebuild schema + validator each call": per_call_us(
+            lambda: StructuredOutputSchema("CalendarEvent", _to_strict_schema(
+                CalendarEvent.model_json_schema()), model=CalendarEvent).parse(sample)
+        ),
+        "Cached schema (TypeAdapter)": per_call_us(
+            lambda: schema_for_model(CalendarEvent).parse(sample)
+        ),
+        "Cached dict schema (compile_schema)": per_call_us(
+            lambda: EVENT_SCHEMA.parse(sample)
+        ),
+        "Pydantic model_validate_json": per_call_us(
+            lambda: CalendarEvent.model_validate_json(sample)
+        ),
+        "Repair path (fenced + trailing comma)": per_call_us(
+            lambda: repair_json('```json\n{"title": "Team sync", "time": "2 PM", "attendees": ["Alice",],}\n```')
+        ),
+    }
+
+    for label, micros in results.items():
+        print(f"{label:<40} {micros:8.1f} µs/call")
+
+    return results
 
 
 def main():
@@ -93,6 +402,9 @@ def main():
     # Example 2: Structured Output
     # generate_structured_output_cfg("Meeting with the team at 2 PM with Alice and Bob")
 
+    # Example 3: Cost of schema handling per request
+    benchmark_structured_overhead()
+
 
 if __name__ == "__main__":
     main()
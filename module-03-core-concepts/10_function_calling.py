@@ -4,15 +4,423 @@
 
 import os
 import json
+import time
+import asyncio
+import inspect
+import threading
+import typing
+from collections import OrderedDict
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import List, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
 
+try:
+    import tiktoken
+except ImportError:  # Fall back to a ~4 chars/token estimate
+    tiktoken = None
+
 load_dotenv()
 client = OpenAI()
 
 
-def get_current_weather(location, unit="celsius"):
-    """Get the current weather in a given location"""
+class ToolResultCache:
+    """
+    TTL cache of tool results keyed by (tool name, canonical arguments).
+
+    Arguments are serialised with sorted keys, so the same call always maps
+    to the same entry whatever order the model emitted them in. Values are
+    kept exactly as given: "Boston" and "boston" are different calls. Only
+    cache tools that are safe to reuse (pure lookups, not actions like
+    sending an email).
+    """
+
+    def __init__(self, ttl=300, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, name, args):
+        return name, json.dumps(args, sort_keys=True, separators=(",", ":"))
+
+    def get(self, name, args):
+        key = self.make_key(name, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, name, args, content):
+        key = self.make_key(name, args)
+        with self._lock:
+            self._entries[key] = (content, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def count_tokens(text, model="gpt-4o"):
+    """Count tokens with tiktoken when available, otherwise estimate"""
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return len(encoding.encode(text))
+
+
+def truncate_tool_output(content, max_tokens=500):
+    """
+    Trim a tool result to a token budget before it enters the context.
+
+    Keeps the head and tail (where status lines and totals usually live)
+    and marks what was dropped, so one huge result cannot blow up every
+    later request in the loop.
+    """
+    tokens = count_tokens(content)
+    if tokens <= max_tokens:
+        return content
+
+    # Characters per token for this content, used to size head/tail slices
+    ratio = len(content) / tokens
+    keep_chars = int(max_tokens * ratio)
+    head = content[:keep_chars * 3 // 4]
+    tail = content[len(content) - keep_chars // 4:]
+    return f"{head}\n... [truncated {tokens - max_tokens} of {tokens} tokens] ...\n{tail}"
+
+
+def summarize_tool_output(content, max_tokens=500, model="gpt-5-mini"):
+    """Alternative to truncation: have a small model condense the output"""
+    if count_tokens(content) <= max_tokens:
+        return content
+
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": f"Summarize this tool output in under {max_tokens} tokens. Keep all numbers, names and errors."},
+            {"role": "user", "content": content}
+        ]
+    )
+    return response.choices[0].message.content
+
+
+class ToolExecutor:
+    """
+    Execute a turn's tool calls concurrently.
+
+    Sync tools run on a thread pool and async tools run on the event loop, so
+    a turn takes roughly as long as its slowest tool instead of the sum of all
+    of them. Each call gets its own timeout, results come back in the order
+    the model requested them, and per-call timings are kept in `timings`.
+    Results are cached only for the tools named in `cacheable`. Use it as a
+    context manager (or call close()) to release the worker threads.
+    """
+
+    def __init__(self, functions, default_timeout=10.0, timeouts=None, max_workers=8,
+                 cache=None, cacheable=None):
+        self.functions = functions
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.cache = cache
+        self.cacheable = set(cacheable or ())   # Opt-in: tools whose results may be reused
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.timings = []
+
+    async def _run_one(self, tool_call):
+        name = tool_call.function.name
+        timeout = self.timeouts.get(name, self.default_timeout)
+        start = time.perf_counter()
+        status = "ok"
+
+        try:
+            function = self.functions[name]
+            args = json.loads(tool_call.function.arguments or "{}")
+            use_cache = self.cache is not None and name in self.cacheable
+            cached = self.cache.get(name, args) if use_cache else None
+
+            if cached is not None:
+                status = "cached"
+                result = cached
+            elif inspect.iscoroutinefunction(function):
+                result = await asyncio.wait_for(function(**args), timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                # The worker thread cannot be killed; on timeout we stop waiting for it
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(self.pool, lambda: function(**args)), timeout
+                )
+            content = result if isinstance(result, str) else json.dumps(result)
+            if use_cache and status == "ok":
+                self.cache.set(name, args, content)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            content = json.dumps({"error": f"{name} timed out after {timeout}s"})
+        except Exception as e:
+            status = "error"
+            content = json.dumps({"error": f"{name} failed: {e}"})
+
+        timing = {
+            "tool": name,
+            "tool_call_id": tool_call.id,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            "status": status
+        }
+        message = {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "name": name,
+            "content": content,
+        }
+        return message, timing
+
+    def _cache_key(self, tool_call):
+        """Cache key for a call, or None if its result must not be shared"""
+        name = tool_call.function.name
+        if self.cache is None or name not in self.cacheable:
+            return None
+        try:
+            return self.cache.make_key(name, json.loads(tool_call.function.arguments or "{}"))
+        except json.JSONDecodeError:
+            return None
+
+    async def _reuse(self, task, tool_call):
+        """Answer a duplicate call in the same turn from the first call's result"""
+        message, _ = await task
+        timing = {"tool": tool_call.function.name, "tool_call_id": tool_call.id,
+                  "duration_ms": 0.0, "status": "deduplicated"}
+        return {**message, "tool_call_id": tool_call.id}, timing
+
+    async def execute_async(self, tool_calls):
+        """Run all tool calls concurrently; returns tool messages in call order"""
+        first_by_key = {}
+        pending = []
+        for tool_call in tool_calls:
+            key = self._cache_key(tool_call)
+            if key is not None and key in first_by_key:
+                pending.append(self._reuse(first_by_key[key], tool_call))
+                continue
+            task = asyncio.ensure_future(self._run_one(tool_call))
+            if key is not None:
+                first_by_key[key] = task
+            pending.append(task)
+
+        outcomes = await asyncio.gather(*pending)
+        self.timings.extend(timing for _, timing in outcomes)
+        return [message for message, _ in outcomes]
+
+    def execute(self, tool_calls):
+        """Synchronous entry point for code that is not already in an event loop"""
+        return asyncio.run(self.execute_async(tool_calls))
+
+    def close(self):
+        """Release the worker threads; tools still running after a timeout are not waited for"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_PYTHON_TO_JSON_TYPE = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+
+def _annotation_to_schema(annotation):
+    """Translate a type hint into a JSON schema fragment"""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is Literal:
+        return {"type": _PYTHON_TO_JSON_TYPE.get(type(args[0]), "string"), "enum": list(args)}
+    if origin is list:
+        return {"type": "array", "items": _annotation_to_schema(args[0]) if args else {}}
+    if origin is typing.Union:
+        non_null = [arg for arg in args if arg is not type(None)]
+        return _annotation_to_schema(non_null[0]) if non_null else {"type": "null"}
+    return {"type": _PYTHON_TO_JSON_TYPE.get(annotation, "string")}
+
+
+def _parse_docstring(doc):
+    """Split a Google-style docstring into a summary and per-argument descriptions"""
+    summary_lines = []
+    arg_docs = {}
+    current_arg = None
+    in_args = False
+    summary_done = False
+
+    for line in inspect.cleandoc(doc or "").splitlines():
+        stripped = line.strip()
+        if stripped in ("Args:", "Arguments:", "Parameters:"):
+            in_args = True
+        elif in_args and stripped.endswith(":") and not line.startswith(" "):
+            in_args = False  # Returns:, Raises:, ...
+        elif in_args and ":" in stripped and line.startswith("    ") and not line.startswith("        "):
+            current_arg, description = stripped.split(":", 1)
+            arg_docs[current_arg.split("(")[0].strip()] = description.strip()
+        elif in_args and current_arg and stripped:
+            arg_docs[current_arg.split("(")[0].strip()] += " " + stripped
+        elif not in_args and not summary_done:
+            if stripped:
+                summary_lines.append(stripped)
+            elif summary_lines:
+                summary_done = True  # Summary is the first paragraph
+
+    return " ".join(summary_lines), arg_docs
+
+
+@lru_cache(maxsize=None)
+def function_schema(func):
+    """Build (once per function) a tool schema from its signature and docstring"""
+    description, arg_docs = _parse_docstring(func.__doc__)
+    hints = typing.get_type_hints(func)
+    properties = {}
+    required = []
+
+    for name, param in inspect.signature(func).parameters.items():
+        prop = _annotation_to_schema(hints.get(name, str))
+        if name in arg_docs:
+            prop["description"] = arg_docs[name]
+        properties[name] = prop
+        if param.default is inspect.Parameter.empty:
+            required.append(name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": required,
+            },
+        },
+    }
+
+
+class ToolRegistry:
+    """
+    Registry that generates tool schemas and picks the relevant ones per request.
+
+    Sending every tool on every request makes large catalogues dominate the
+    prompt. Here each tool description is embedded once; per request, the
+    user message is embedded and only the top-k most similar tools are
+    attached. `report()` shows the prompt tokens saved and the selection
+    latency this costs.
+    """
+
+    def __init__(self, embedding_model="text-embedding-3-small"):
+        self.embedding_model = embedding_model
+        self._tools = OrderedDict()  # name -> (function, schema, token count, always_include)
+        self._names = []
+        self._matrix = None          # Normalised description embeddings, one row per tool
+        self._query_cache = OrderedDict()
+        self.stats = {"requests": 0, "full_tokens": 0, "sent_tokens": 0, "selection_ms": 0.0}
+
+    def register(self, func=None, *, always_include=False):
+        """Decorator: @registry.register or @registry.register(always_include=True)"""
+        def decorator(f):
+            schema = function_schema(f)
+            self._tools[f.__name__] = (f, schema, count_tokens(json.dumps(schema)), always_include)
+            self._matrix = None  # Re-embed on next selection
+            return f
+        return decorator(func) if func else decorator
+
+    @property
+    def functions(self):
+        return {name: entry[0] for name, entry in self._tools.items()}
+
+    def schemas(self, names=None):
+        names = names if names is not None else list(self._tools)
+        return [self._tools[name][1] for name in names]
+
+    def _embed(self, texts):
+        response = client.embeddings.create(input=texts, model=self.embedding_model)
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def _ensure_index(self):
+        if self._matrix is None:
+            self._names = list(self._tools)
+            descriptions = [
+                f"{name}: {self._tools[name][1]['function']['description']}" for name in self._names
+            ]
+            self._matrix = self._embed(descriptions)  # One batched call for the whole catalogue
+
+    def _embed_query(self, text):
+        if text in self._query_cache:
+            self._query_cache.move_to_end(text)  # LRU: frequent queries stay cached
+            return self._query_cache[text]
+        vector = self._embed([text.replace("\n", " ")])[0]
+        self._query_cache[text] = vector
+        if len(self._query_cache) > 1024:
+            self._query_cache.popitem(last=False)
+        return vector
+
+    def select(self, user_message, k=5):
+        """Return schemas for the k tools most relevant to user_message"""
+        start = time.perf_counter()
+
+        if len(self._tools) <= k:
+            names = list(self._tools)  # Nothing to trim - skip the embedding call
+        else:
+            self._ensure_index()
+            scores = self._matrix @ self._embed_query(user_message)
+            top = [self._names[i] for i in np.argsort(-scores)[:k]]
+            pinned = [name for name, entry in self._tools.items() if entry[3] and name not in top]
+            names = top + pinned
+
+        self.stats["requests"] += 1
+        self.stats["selection_ms"] += (time.perf_counter() - start) * 1000
+        self.stats["full_tokens"] += sum(entry[2] for entry in self._tools.values())
+        self.stats["sent_tokens"] += sum(self._tools[name][2] for name in names)
+        return self.schemas(names)
+
+    def report(self):
+        """Average prompt tokens for tools, with and without selection"""
+        requests = self.stats["requests"] or 1
+        full = self.stats["full_tokens"] / requests
+        sent = self.stats["sent_tokens"] / requests
+        return {
+            "tools_registered": len(self._tools),
+            "avg_tool_tokens_full": round(full, 1),
+            "avg_tool_tokens_sent": round(sent, 1),
+            "token_savings_pct": round(100 * (1 - sent / full), 1) if full else 0.0,
+            "avg_selection_ms": round(self.stats["selection_ms"] / requests, 2),
+        }
+
+
+registry = ToolRegistry()
+
+
+@registry.register
+def get_current_weather(location: str, unit: Literal["celsius", "fahrenheit"] = "celsius"):
+    """Get the current weather in a given location
+
+    Args:
+        location: The city and state, e.g. San Francisco, CA
+        unit: Temperature unit for the reading
+    """
     # Mock API call
     weather_info = {
         "location": location,
@@ -23,91 +431,172 @@ def get_current_weather(location, unit="celsius"):
     return json.dumps(weather_info)
 
 
+@registry.register
+def get_stock_price(ticker: str):
+    """Get the latest trading price for a stock
+
+    Args:
+        ticker: Stock ticker symbol, e.g. AAPL
+    """
+    return json.dumps({"ticker": ticker.upper(), "price": 187.42, "currency": "USD"})
+
+
+@registry.register
+def convert_currency(amount: float, from_currency: str, to_currency: str):
+    """Convert an amount of money between two currencies
+
+    Args:
+        amount: Amount to convert
+        from_currency: ISO code of the source currency, e.g. USD
+        to_currency: ISO code of the target currency, e.g. EUR
+    """
+    return json.dumps({"amount": round(amount * 0.92, 2), "currency": to_currency})
+
+
+@registry.register
+def search_restaurants(city: str, cuisine: Optional[str] = None, max_results: int = 5):
+    """Find restaurants in a city, optionally filtered by cuisine
+
+    Args:
+        city: City to search in
+        cuisine: Type of food, e.g. italian
+        max_results: Maximum number of restaurants to return
+    """
+    return json.dumps({"city": city, "results": ["Trattoria Roma", "Blue Ginger"][:max_results]})
+
+
+@registry.register
+def list_calendar_events(date: str, attendees: List[str] = None):
+    """List calendar events on a given day
+
+    Args:
+        date: Day to look up in YYYY-MM-DD format
+        attendees: Only include events with these people
+    """
+    return json.dumps({"date": date, "events": []})
+
+
+def run_tool_loop(messages, tools, functions, model="gpt-5-mini", max_steps=5,
+                  cache=None, cacheable=(), max_tool_tokens=500, compress=truncate_tool_output):
+    """
+    Agentic tool loop: call the model, run its tools, repeat until it answers.
+
+    - max_steps bounds the number of tool rounds; after that the model is
+      asked to answer with what it has (tool_choice="none").
+    - cache reuses results of identical calls to the tools named in
+      cacheable across steps and turns.
+    - compress (truncate or summarize) keeps each tool result within
+      max_tool_tokens so the prompt does not balloon step after step.
+
+    Returns (final_text, messages, executor) - the executor holds timings.
+    """
+    with ToolExecutor(functions, cache=cache, cacheable=cacheable) as executor:
+        for step in range(max_steps):
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                tools=tools,
+                tool_choice="auto"
+            )
+            response_message = response.choices[0].message
+
+            if not response_message.tool_calls:
+                return response_message.content, messages, executor
+
+            print(f"Step {step + 1}: {len(response_message.tool_calls)} tool call(s)")
+            messages.append(response_message)
+
+            for tool_message in executor.execute(response_message.tool_calls):
+                tool_message["content"] = compress(tool_message["content"], max_tool_tokens)
+                messages.append(tool_message)
+
+    # Step limit reached - force a final answer from the results so far
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=tools,
+        tool_choice="none"
+    )
+    return response.choices[0].message.content, messages, executor
+
+
+# Shared across conversations so repeated lookups skip the tool entirely
+tool_cache = ToolResultCache(ttl=300)
+
+
 def run_conversation():
     print("\n" + "="*60)
     print("FUNCTION CALLING")
     print("="*60)
 
-    # Step 1: Define tools
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_current_weather",
-                "description": "Get the current weather in a given location",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "location": {
-                            "type": "string",
-                            "description": "The city and state, e.g. San Francisco, CA",
-                        },
-                        "unit": {"type": "string", "enum": ["celsius", "fahrenheit"]},
-                    },
-                    "required": ["location"],
-                },
-            },
-        }
-    ]
+    # Step 1: Pick the relevant tools (schemas generated from the functions)
+    question = "What's the weather like in Boston? Compare it with Paris."
+    tools = registry.select(question, k=2)
+    print(f"Tools attached: {[tool['function']['name'] for tool in tools]}")
 
-    # Step 2: Send conversation + tools to model
-    messages = [{"role": "user", "content": "What's the weather like in Boston?"}]
-    
-    response = client.chat.completions.create(
-        model="gpt-5-mini",
-        messages=messages,
-        tools=tools,
-        tool_choice="auto"
+    # Step 2: Let the model call tools until it can answer
+    messages = [{"role": "user", "content": question}]
+
+    final_text, messages, executor = run_tool_loop(
+        messages,
+        tools,
+        registry.functions,
+        max_steps=4,
+        cache=tool_cache,
+        cacheable=("get_current_weather", "get_stock_price"),   # Pure lookups only
+        max_tool_tokens=300
     )
 
-    response_message = response.choices[0].message
-    tool_calls = response_message.tool_calls
+    # Step 3: Inspect what the tools cost
+    for timing in executor.timings:
+        print(f"  {timing['tool']}: {timing['duration_ms']}ms ({timing['status']})")
+    print(f"  Tool cache: {tool_cache.hits} hits / {tool_cache.misses} misses")
+    print(f"  Tool registry: {registry.report()}")
 
-    # Step 3: Check if model wanted to call a function
-    if tool_calls:
-        print(f"Tool calls detected: {len(tool_calls)}")
-        
-        # Extend conversation with assistant's reply
-        messages.append(response_message)
+    print(f"\nFinal Response: {final_text}")
 
-        available_functions = {
-            "get_current_weather": get_current_weather,
-        }
 
-        # Step 4: Execute function calls
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_to_call = available_functions[function_name]
-            function_args = json.loads(tool_call.function.arguments)
-            
-            print(f"Calling function: {function_name} with args: {function_args}")
-            
-            function_response = function_to_call(
-                location=function_args.get("location"),
-                unit=function_args.get("unit"),
-            )
-            
-            # Step 5: Send function result back to model
-            messages.append(
-                {
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": function_response,
-                }
-            )
+def demonstrate_parallel_tools():
+    """Show sequential vs parallel tool latency without calling the API"""
+    print("\n" + "="*60)
+    print("PARALLEL TOOL EXECUTION")
+    print("="*60)
+
+    def slow_lookup(city, delay):
+        time.sleep(delay)
+        return get_current_weather(city)
+
+    async def slow_async_lookup(city, delay):
+        await asyncio.sleep(delay)
+        return get_current_weather(city)
+
+    def fake_call(call_id, name, **args):
+        return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+    tool_calls = [
+        fake_call("call_1", "slow_lookup", city="Boston", delay=0.3),
+        fake_call("call_2", "slow_async_lookup", city="Paris", delay=0.5),
+        fake_call("call_3", "slow_lookup", city="Tokyo", delay=0.2),
+        fake_call("call_4", "slow_lookup", city="Lima", delay=5),
+    ]
+
+    with ToolExecutor(
+        {"slow_lookup": slow_lookup, "slow_async_lookup": slow_async_lookup},
+        default_timeout=2.0
+    ) as executor:
+        start = time.perf_counter()
+        results = executor.execute(tool_calls)
+        elapsed = time.perf_counter() - start
 
-        # Step 6: Get final response
-        second_response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=messages
-        )
-        
-        print(f"\nFinal Response: {second_response.choices[0].message.content}")
+    for result, timing in zip(results, executor.timings):
+        print(f"{result['tool_call_id']}: {timing['duration_ms']:7.1f}ms {timing['status']:<8} {result['content'][:50]}")
+    print(f"\nSequential would take ~6.0s, parallel took {elapsed:.2f}s (bounded by the 2s timeout)")
 
 
 def main():
+    demonstrate_parallel_tools()
     run_conversation()
+    run_conversation()  # Same question again - weather lookups come from the cache
 
 
 if __name__ == "__main__":
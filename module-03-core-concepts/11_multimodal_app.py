@@ -4,11 +4,15 @@
 
 import os
 import json
+import time
+import asyncio
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 load_dotenv()
 client = OpenAI()
+async_client = AsyncOpenAI()
 
 
 class MultiModalAssistant:
@@ -76,11 +80,189 @@ class MultiModalAssistant:
         }
 
 
+class StageTimer:
+    """Record when each stage of a workflow starts and ends"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.stages[name] = {
+                "start_ms": round((start - self.origin) * 1000, 1),
+                "end_ms": round((end - self.origin) * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1),
+            }
+
+    def breakdown(self):
+        """Per-stage timings plus wall time vs. what running serially would cost"""
+        wall_ms = max((s["end_ms"] for s in self.stages.values()), default=0.0)
+        serial_ms = sum(s["duration_ms"] for s in self.stages.values())
+        return {
+            "stages": self.stages,
+            "wall_ms": wall_ms,
+            "serial_ms": round(serial_ms, 1),
+            "slowest_stage_ms": max((s["duration_ms"] for s in self.stages.values()), default=0.0),
+        }
+
+
+class AsyncMultiModalAssistant(MultiModalAssistant):
+    """
+    Async variant that overlaps work across modalities.
+
+    - Transcription is streamed; each finished chunk of sentences is sent
+      for analysis while the rest of the audio is still being transcribed.
+    - Independent calls (e.g. image + audio) run concurrently.
+    Every workflow returns a per-stage latency breakdown, so you can check
+    that the total is close to the slowest stage rather than the sum.
+    """
+
+    SEGMENT_CHARS = 400  # Analyse the transcript in roughly paragraph-sized pieces
+
+    def __init__(self):
+        super().__init__()
+        self._history_lock = asyncio.Lock()
+
+    async def _complete(self, prompt, model="gpt-5-mini"):
+        """Stateless completion - safe to run many at once"""
+        response = await async_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.choices[0].message.content
+
+    async def process_text_async(self, user_input):
+        """Process text input, keeping the conversation history consistent"""
+        async with self._history_lock:
+            self.conversation_history.append({"role": "user", "content": user_input})
+            response = await async_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self.conversation_history
+            )
+            assistant_message = response.choices[0].message.content
+            self.conversation_history.append({"role": "assistant", "content": assistant_message})
+            return assistant_message
+
+    async def process_image_and_text_async(self, image_url, question):
+        """Process image with text question"""
+        response = await async_client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": question},
+                        {"type": "image_url", "image_url": {"url": image_url}}
+                    ]
+                }
+            ]
+        )
+        return response.choices[0].message.content
+
+    async def _timed(self, timer, name, coro):
+        with timer.stage(name):
+            return await coro
+
+    async def transcribe_and_analyze_async(self, audio_file_path, timer=None):
+        """Stream the transcript into incremental analysis, then merge the notes"""
+        timer = timer or StageTimer()
+        segment_tasks = []
+        transcript = ""
+        pending = ""
+
+        def launch(segment):
+            index = len(segment_tasks) + 1
+            prompt = f"List the key points of this part of a transcript:\n\n{segment}"
+            segment_tasks.append(asyncio.create_task(
+                self._timed(timer, f"analyze_segment_{index}", self._complete(prompt))
+            ))
+
+        with timer.stage("transcribe"):
+            with open(audio_file_path, "rb") as audio_file:
+                stream = await async_client.audio.transcriptions.create(
+                    model="gpt-4o-mini-transcribe",  # Streaming needs a gpt-4o transcribe model
+                    file=audio_file,
+                    stream=True
+                )
+                async for event in stream:
+                    if event.type != "transcript.text.delta":
+                        continue
+                    transcript += event.delta
+                    pending += event.delta
+
+                    # Hand off whole sentences once we have enough text
+                    if len(pending) >= self.SEGMENT_CHARS:
+                        boundary = max(pending.rfind(". "), pending.rfind("? "), pending.rfind("! "))
+                        if boundary > 0:
+                            launch(pending[:boundary + 1])
+                            pending = pending[boundary + 2:]
+
+        if pending.strip():
+            launch(pending)
+
+        partial_notes = await asyncio.gather(*segment_tasks)
+
+        if len(partial_notes) == 1:
+            analysis = partial_notes[0]
+        else:
+            notes = "\n\n".join(f"Part {i + 1}:\n{note}" for i, note in enumerate(partial_notes))
+            with timer.stage("merge_analysis"):
+                analysis = await self._complete(
+                    f"Merge these notes into one list of key points, removing duplicates:\n\n{notes}"
+                )
+
+        return {
+            "transcript": transcript,
+            "analysis": analysis,
+            "latency": timer.breakdown()
+        }
+
+    async def analyze_audio_and_image(self, audio_file_path, image_url, question):
+        """Run the audio and vision pipelines side by side"""
+        timer = StageTimer()
+        audio_result, image_answer = await asyncio.gather(
+            self.transcribe_and_analyze_async(audio_file_path, timer=timer),
+            self._timed(timer, "vision", self.process_image_and_text_async(image_url, question)),
+        )
+        return {
+            "transcript": audio_result["transcript"],
+            "analysis": audio_result["analysis"],
+            "image_answer": image_answer,
+            "latency": timer.breakdown()
+        }
+
+
+def print_latency(breakdown):
+    """Pretty-print a StageTimer breakdown"""
+    for name, stage in sorted(breakdown["stages"].items(), key=lambda item: item[1]["start_ms"]):
+        print(f"  {name:<22} {stage['start_ms']:>8.0f}ms → {stage['end_ms']:>8.0f}ms ({stage['duration_ms']:.0f}ms)")
+    print(f"  Wall time: {breakdown['wall_ms']:.0f}ms "
+          f"(serial would be {breakdown['serial_ms']:.0f}ms, slowest stage {breakdown['slowest_stage_ms']:.0f}ms)")
+
+
 def main():
     print("Multi-Modal Applications")
 
     assistant = MultiModalAssistant()
 
+    # Overlapped audio + vision (requires a local audio file)
+    audio_path = "meeting.mp3"
+    if os.path.exists(audio_path):
+        async_assistant = AsyncMultiModalAssistant()
+        result = asyncio.run(async_assistant.analyze_audio_and_image(
+            audio_path,
+            "https://upload.wikimedia.org/wikipedia/commons/a/a9/Adidas_Sneaker.jpg",
+            "What product is shown here?"
+        ))
+        print(result["analysis"])
+        print_latency(result["latency"])
+
     print("\n" + "="*60)
     print("MULTI-MODAL CAPABILITIES")
     print("="*60)
@@ -3,48 +3,158 @@
 """
 
 import os
+import re
 import time
+import random
+import asyncio
+import threading
+import uuid
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
-from openai import OpenAI, RateLimitError
+from openai import OpenAI, APIConnectionError, APIStatusError
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a ~4 chars/token estimate
+    tiktoken = None
 
 load_dotenv()
-client = OpenAI()
+# Retries are handled below; the SDK's own 2 would multiply with ours
+client = OpenAI(max_retries=0)
+
+
+def parse_reset_duration(value):
+    """Convert a reset header like '1s', '6m0s' or '20ms' to seconds"""
+    if not value:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
 
 
 def get_rate_limit_info(response):
-    """Extract rate limit information from response headers"""
-    # Note: In actual implementation, you'd need to access response headers
-    # This is a simplified example
+    """
+    Extract rate limit information from response headers.
+
+    Pass a raw response (client.chat.completions.with_raw_response.create)
+    or any mapping of headers.
+    """
+    headers = getattr(response, "headers", response)
+
+    def as_int(name):
+        value = headers.get(name)
+        return int(value) if value is not None else None
+
     return {
-        "requests_limit": "10,000/min",
-        "tokens_limit": "2,000,000/min",
-        "requests_remaining": "9,998",
-        "tokens_remaining": "1,999,500"
+        "requests_limit": as_int("x-ratelimit-limit-requests"),
+        "tokens_limit": as_int("x-ratelimit-limit-tokens"),
+        "requests_remaining": as_int("x-ratelimit-remaining-requests"),
+        "tokens_remaining": as_int("x-ratelimit-remaining-tokens"),
+        "requests_reset_seconds": parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+        "tokens_reset_seconds": parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
     }
 
 
-def make_request_with_retry(prompt, max_retries=5):
-    """Make request with exponential backoff retry logic"""
+def estimate_request_tokens(messages, model="gpt-3.5-turbo", max_completion_tokens=0):
+    """
+    Pre-count the tokens a request will be charged against TPM.
+
+    Rate limits count prompt tokens plus the requested completion budget, so
+    pass max_completion_tokens if you set one.
+    """
+    text = "".join(str(m.get("content") or "") for m in messages)
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        prompt_tokens = len(encoding.encode(text))
+    else:
+        prompt_tokens = len(text) // 4 + 1
+    # ~4 tokens of framing per message plus 3 to prime the reply
+    return prompt_tokens + 4 * len(messages) + 3 + max_completion_tokens
+
+
+def retry_after_seconds(headers):
+    """
+    Seconds the server asks us to wait, or None.
+
+    Reads retry-after-ms, then retry-after (seconds or an HTTP date), then
+    falls back to the reset header of whichever limit is exhausted.
+    Malformed values are ignored rather than raised.
+    """
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+    except ValueError:
+        pass
+
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    try:
+        info = get_rate_limit_info(headers)
+    except ValueError:
+        return None
+    resets = [info[f"{kind}_reset_seconds"] for kind in ("requests", "tokens")
+              if info[f"{kind}_remaining"] == 0 and info[f"{kind}_reset_seconds"] is not None]
+    return max(resets) if resets else None
+
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def make_request_with_retry(prompt, max_retries=5, max_delay=30):
+    """
+    Make request with jittered backoff that honours the server's retry-after.
+
+    429s (except insufficient_quota), 408/409/5xx, timeouts and connection
+    errors are retried; other 4xx are not. One Idempotency-Key is sent on
+    every attempt, so a retry after a 5xx or timeout that the server had in
+    fact processed is dropped as a duplicate instead of being run twice.
+    """
     base_delay = 1  # seconds
+    delay = base_delay
+    idempotency_key = str(uuid.uuid4())
 
     for attempt in range(max_retries):
         try:
             response = client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                extra_headers={"Idempotency-Key": idempotency_key}
             )
             return response.choices[0].message.content
 
-        except RateLimitError as e:
-            if attempt < max_retries - 1:
-                # Exponential backoff: 1s, 2s, 4s, 8s, 16s
-                wait_time = base_delay * (2 ** attempt)
-                print(f"Rate limit hit. Retrying in {wait_time}s... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
+        except (APIStatusError, APIConnectionError) as e:
+            if isinstance(e, APIStatusError):
+                # Out of credits will not fix itself by waiting
+                retryable = e.status_code in RETRYABLE_STATUS and getattr(e, "code", None) != "insufficient_quota"
             else:
-                print(f"Max retries reached. Error: {e}")
+                retryable = True  # Timeouts and dropped connections
+            if not retryable or attempt == max_retries - 1:
+                print(f"Not retrying. Error: {e}")
                 raise
 
+            # Decorrelated jitter: spreads clients out instead of retrying in lockstep
+            delay = min(max_delay, random.uniform(base_delay, delay * 3))
+            response = getattr(e, "response", None)
+            server_delay = retry_after_seconds(response.headers) if response is not None else None
+            if server_delay is not None:
+                delay = max(delay, server_delay)
+
+            print(f"{type(e).__name__}. Retrying in {delay:.1f}s... (Attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
 
 class RateLimitManager:
     """Manage rate limits with token bucket algorithm"""
@@ -97,6 +207,193 @@ class RateLimitManager:
         self.token_tokens -= tokens_used
 
 
+class TokenBucket:
+    """A single bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity, per_seconds=60):
+        self.capacity = capacity
+        self.refill_rate = capacity / per_seconds
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 if available now)"""
+        if self.level >= amount:
+            return 0.0
+        return (min(amount, self.capacity) - self.level) / self.refill_rate
+
+
+class ModelRateLimiter:
+    """
+    Thread-safe, async-aware token-bucket limiter with one pair of buckets per model.
+
+    Unlike RateLimitManager.can_make_request(), acquire() does not say no -
+    it blocks (or awaits) until the request fits, so callers are scheduled
+    instead of failing. Buckets learn from the server: update_from_headers()
+    resynchronises them from x-ratelimit-* headers (levels from remaining,
+    refill pace from reset). When a response carries no headers, reconcile()
+    corrects the pre-counted token estimate with the actual usage instead.
+    """
+
+    DEFAULT_LIMITS = {
+        "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+        "gpt-4o": {"rpm": 500, "tpm": 30000},
+        "gpt-5-mini": {"rpm": 500, "tpm": 200000},
+    }
+
+    def __init__(self, limits=None, default_rpm=60, default_tpm=90000):
+        self.limits = {**self.DEFAULT_LIMITS, **(limits or {})}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self._buckets = {}  # model -> (requests bucket, tokens bucket)
+        self._lock = threading.Condition()
+
+    def _buckets_for(self, model):
+        if model not in self._buckets:
+            config = self.limits.get(model, {})
+            self._buckets[model] = (
+                TokenBucket(config.get("rpm", self.default_rpm)),
+                TokenBucket(config.get("tpm", self.default_tpm)),
+            )
+        return self._buckets[model]
+
+    def _try_acquire(self, model, tokens):
+        """Take capacity if available; otherwise return seconds to wait"""
+        requests_bucket, tokens_bucket = self._buckets_for(model)
+        now = time.monotonic()
+        requests_bucket.refill(now)
+        tokens_bucket.refill(now)
+        # A request larger than the whole bucket is let through once it is full
+        tokens = min(tokens, tokens_bucket.capacity)
+
+        wait = max(requests_bucket.wait_time(1), tokens_bucket.wait_time(tokens))
+        if wait == 0:
+            requests_bucket.level -= 1
+            tokens_bucket.level -= tokens
+        return wait
+
+    def acquire(self, model, tokens, timeout=None):
+        """Block until the request fits; returns False if timeout elapses first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                wait = self._try_acquire(model, tokens)
+                if wait == 0:
+                    return True
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                # Woken early if headers/reconcile free up capacity
+                self._lock.wait(wait)
+
+    async def acquire_async(self, model, tokens):
+        """Await until the request fits without blocking the event loop"""
+        while True:
+            with self._lock:
+                wait = self._try_acquire(model, tokens)
+            if wait == 0:
+                return True
+            await asyncio.sleep(wait)
+
+    def reconcile(self, model, estimated_tokens, actual_tokens):
+        """Refund (or charge) the difference between estimate and actual usage"""
+        with self._lock:
+            _, tokens_bucket = self._buckets_for(model)
+            tokens_bucket.level = min(
+                tokens_bucket.capacity,
+                tokens_bucket.level + (estimated_tokens - actual_tokens)
+            )
+            self._lock.notify_all()
+
+    def update_from_headers(self, model, headers):
+        """
+        Resynchronise a model's buckets with the server's view.
+
+        Returns True if the token level was taken from the server. It then
+        already includes this request's real usage, so there is nothing
+        left to reconcile.
+        """
+        info = get_rate_limit_info(headers)
+        with self._lock:
+            requests_bucket, tokens_bucket = self._buckets_for(model)
+            now = time.monotonic()
+            for bucket, limit, remaining, reset in (
+                (requests_bucket, info["requests_limit"], info["requests_remaining"], info["requests_reset_seconds"]),
+                (tokens_bucket, info["tokens_limit"], info["tokens_remaining"], info["tokens_reset_seconds"]),
+            ):
+                bucket.refill(now)
+                if limit:
+                    bucket.capacity = limit
+                    bucket.refill_rate = limit / 60
+                if remaining is not None:
+                    # The server also counts traffic from other clients on this key
+                    bucket.level = min(remaining, bucket.capacity)
+                    if reset and bucket.level < bucket.capacity:
+                        # reset = time until the server's bucket is full again: refill at that pace
+                        bucket.refill_rate = (bucket.capacity - bucket.level) / reset
+            self._lock.notify_all()
+            return info["tokens_remaining"] is not None
+
+    def snapshot(self):
+        """Current bucket levels per model"""
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for model, (requests_bucket, tokens_bucket) in self._buckets.items():
+                requests_bucket.refill(now)
+                tokens_bucket.refill(now)
+                result[model] = {
+                    "requests_available": round(requests_bucket.level, 2),
+                    "tokens_available": round(tokens_bucket.level),
+                }
+            return result
+
+
+limiter = ModelRateLimiter()
+
+
+def limited_chat_completion(messages, model="gpt-3.5-turbo", **kwargs):
+    """Chat completion that waits for rate-limit capacity and learns from the response"""
+    estimated = estimate_request_tokens(messages, model, kwargs.get("max_completion_tokens", 0))
+    limiter.acquire(model, estimated)
+
+    # with_raw_response exposes the x-ratelimit-* headers alongside the parsed body
+    raw = client.chat.completions.with_raw_response.create(
+        model=model,
+        messages=messages,
+        **kwargs
+    )
+    completion = raw.parse()
+
+    # Remaining counts from the server already include this request's usage
+    if not limiter.update_from_headers(model, raw.headers):
+        limiter.reconcile(model, estimated, completion.usage.total_tokens)
+    return completion
+
+
+def demo_limiter_scheduling():
+    """Offline demo: 8 threads share a 120 RPM budget and get scheduled, not rejected"""
+    demo = ModelRateLimiter(limits={"demo-model": {"rpm": 120, "tpm": 100000}})
+    demo._buckets_for("demo-model")[0].level = 2  # Start nearly empty
+    start = time.monotonic()
+
+    def worker(i):
+        demo.acquire("demo-model", tokens=500)
+        print(f"  worker {i} admitted at {time.monotonic() - start:.2f}s")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
 # Rate Limiting Best Practices
 rate_limit_guide = """
 RATE LIMITING BEST PRACTICES:
@@ -133,3 +430,7 @@ TPM (Tokens Per Minute) limits vary by model.
 """
 
 print(rate_limit_guide)
+
+if __name__ == "__main__":
+    print("Scheduling requests with ModelRateLimiter (120 RPM ≈ one every 0.5s):")
+    demo_limiter_scheduling()
@@ -5,6 +5,13 @@
 import os
 import json
 import time
+import uuid
+import zlib
+import queue
+import atexit
+import tempfile
+import threading
+import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
 
@@ -27,7 +34,7 @@ def make_request_with_debugging(prompt):
             messages=[{"role": "user", "content": prompt}],
             # Add custom headers for tracking
             extra_headers={
-                "X-Client-Request-Id": f"req_{int(time.time())}"
+                "X-Client-Request-Id": f"req_{uuid.uuid4().hex}"  # Unique per request, unlike a timestamp
             }
         )
 
@@ -57,14 +64,231 @@ def make_request_with_debugging(prompt):
         raise
 
 
+# Sidecar index: one fixed-size record per log line, in file order
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8"), ("model", "<u4"), ("status", "u1"), ("_pad", "V3")])
+STATUS_CODES = {"success": 0, "error": 1}
+
+
+def model_hash(model):
+    return zlib.crc32(model.encode("utf-8")) if model else 0
+
+
+def build_index(log_path):
+    """Create the sidecar index for an existing log with one forward pass"""
+    entries = []
+    offset = 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {}
+            entries.append((record.get("timestamp", 0.0), offset,
+                            model_hash(record.get("model")), STATUS_CODES.get(record.get("status"), 2), b""))
+            offset += len(line)
+    with open(f"{log_path}.idx", "wb") as f:
+        f.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+
+
+def index_is_current(log_path):
+    """True if the sidecar index ends exactly where the log file ends"""
+    index_path = f"{log_path}.idx"
+    if not os.path.exists(index_path):
+        return False
+    index_size = os.path.getsize(index_path)
+    log_size = os.path.getsize(log_path)
+    if index_size % INDEX_DTYPE.itemsize:
+        return False
+    if not index_size:
+        return not log_size
+    # A writer without index=True may have appended since: the last indexed line must end at EOF
+    last = np.fromfile(index_path, dtype=INDEX_DTYPE, offset=index_size - INDEX_DTYPE.itemsize)
+    offset = int(last["offset"][0])
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        return offset + len(f.readline()) == log_size
+
+
+def read_lines_reversed(path, block_size=64 * 1024):
+    """Yield a file's lines last-to-first, reading fixed-size blocks backwards from the end"""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b"\n")
+            remainder = lines.pop(0)  # May continue in the previous block
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if remainder:
+            yield remainder
+
+
+class BatchedLogWriter:
+    """
+    Write JSON log records from a background thread.
+
+    submit() only puts the record dict on a bounded queue (a couple of
+    microseconds), so logging never waits on disk. The writer thread drains
+    the queue in batches, serialises them and writes each batch with one
+    write() call. Files rotate by size and/or age (api_requests.log.1, .2, ...).
+
+    When the queue is full, policy="drop" discards the record and counts it,
+    and policy="block" makes the caller wait (backpressure).
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=512, flush_interval=0.5,
+                 max_bytes=100 * 1024 * 1024, rotate_seconds=None, backup_count=5, policy="drop",
+                 index=False):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.policy = policy
+        self.index_path = f"{path}.idx" if index else None
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0}
+        self._file = None
+        self._index_file = None
+        self._opened_at = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record):
+        """Queue a record dict; returns False if it was dropped"""
+        if self.policy == "block":
+            self.queue.put(record)
+            return True
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    self._write(records)
+                    self.stats["written"] += len(records)
+                    self.stats["batches"] += 1
+            except (OSError, TypeError, ValueError) as e:
+                # Never let one bad batch kill the writer (and hang flush())
+                self.stats["dropped"] += len(records)
+                print(f"Log writer error: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        lines = [json.dumps(record).encode("utf-8") + b"\n" for record in records]
+        data = b"".join(lines)
+        if self._file is None:
+            self._open()  # May append to a file an earlier process left nearly full
+        if self._should_rotate(len(data)):
+            self._rotate()
+
+        start = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+
+        # Index after the data, so a failed write can never leave offsets pointing past EOF
+        if self._index_file:
+            entries = np.zeros(len(records), dtype=INDEX_DTYPE)
+            entries["timestamp"] = [record.get("timestamp", 0.0) for record in records]
+            entries["offset"] = start + np.cumsum([0] + [len(line) for line in lines[:-1]])
+            entries["model"] = [model_hash(record.get("model")) for record in records]
+            entries["status"] = [STATUS_CODES.get(record.get("status"), 2) for record in records]
+            self._index_file.write(entries.tobytes())
+            self._index_file.flush()
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        if self.index_path:
+            # An index only makes sense if it covers the whole file
+            if os.path.getsize(self.path) and not index_is_current(self.path):
+                build_index(self.path)
+            self._index_file = open(self.index_path, "ab")
+        elif os.path.exists(f"{self.path}.idx"):
+            os.remove(f"{self.path}.idx")  # Lines written from now on would be missing from it
+        self._opened_at = time.time()
+
+    def _should_rotate(self, incoming):
+        if not self._file.tell():
+            return False  # Rotating an empty file would only shift the backups
+        if self.max_bytes and self._file.tell() + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self._file.close()
+        if self._index_file:
+            self._index_file.close()
+        for suffix in ("", ".idx"):
+            for i in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}{suffix}"):
+                    os.replace(f"{self.path}.{i}{suffix}", f"{self.path}.{i + 1}{suffix}")
+            if not os.path.exists(f"{self.path}{suffix}"):
+                continue
+            if self.backup_count:
+                os.replace(f"{self.path}{suffix}", f"{self.path}.1{suffix}")
+            else:
+                os.remove(f"{self.path}{suffix}")
+        self.stats["rotations"] += 1
+        self._open()
+
+    def flush(self):
+        """Block until everything submitted so far is on disk"""
+        self.queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(None)  # Sentinel: written after everything queued before it
+        self._thread.join()
+        if self._file:
+            self._file.close()
+        if self._index_file:
+            self._index_file.close()
+
+
 class RequestLogger:
     """Log all API requests for debugging"""
 
-    def __init__(self, log_file="api_requests.log"):
+    def __init__(self, log_file="api_requests.log", policy="drop", index=False, **writer_options):
         self.log_file = log_file
+        self.index_path = f"{log_file}.idx"
+        self.writer = BatchedLogWriter(log_file, policy=policy, index=index, **writer_options)
 
     def log_request(self, prompt, response=None, error=None):
-        """Log request details"""
+        """Log request details (queued; written in the background)"""
         log_entry = {
             "timestamp": time.time(),
             "prompt": prompt[:100] + "..." if len(prompt) > 100 else prompt,
@@ -84,19 +308,60 @@ class RequestLogger:
                 "error_message": str(error)
             })
 
-        # Append to log file
-        with open(self.log_file, "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        self.writer.submit(log_entry)
 
     def get_recent_logs(self, n=10):
-        """Get recent log entries"""
-        try:
-            with open(self.log_file, "r") as f:
-                lines = f.readlines()
-                recent = lines[-n:] if len(lines) >= n else lines
-                return [json.loads(line) for line in recent]
-        except FileNotFoundError:
+        """Get recent log entries, oldest first as in the file (reads only the end of it)"""
+        return self.query(n=n)[::-1]
+
+    def query(self, n=100, model=None, status=None, since=None):
+        """
+        Newest-first entries matching model/status, logged at or after `since`.
+
+        With a sidecar index, the time range is found by binary search and
+        filtered in one vectorised pass, then only matching lines are read.
+        Without one, the file is read backwards and the scan stops at `since`.
+        """
+        self.writer.flush()
+        if not os.path.exists(self.log_file):
             return []
+        if index_is_current(self.log_file):
+            return self._query_index(n, model, status, since)
+
+        results = []
+        for line in read_lines_reversed(self.log_file):
+            entry = json.loads(line)
+            if since is not None and entry["timestamp"] < since:
+                break  # Entries are in time order, so nothing older can match
+            if (model is None or entry.get("model") == model) and (status is None or entry.get("status") == status):
+                results.append(entry)
+                if len(results) >= n:
+                    break
+        return results
+
+    def _query_index(self, n, model, status, since):
+        if not os.path.getsize(self.index_path):
+            return []
+        # Memory-mapped: the binary search only touches a few pages of a large index
+        index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="r")
+        start = int(np.searchsorted(index["timestamp"], since)) if since is not None else 0
+        candidates = index[start:]
+
+        mask = np.ones(len(candidates), dtype=bool)
+        if model is not None:
+            mask &= candidates["model"] == model_hash(model)
+        if status is not None:
+            mask &= candidates["status"] == STATUS_CODES.get(status, 2)
+        offsets = candidates["offset"][mask][-n:][::-1]
+
+        results = []
+        with open(self.log_file, "rb") as f:
+            for offset in offsets:
+                f.seek(int(offset))
+                entry = json.loads(f.readline())
+                if model is None or entry.get("model") == model:  # Guard against hash collisions
+                    results.append(entry)
+        return results
 
 
 # Debugging Tips
@@ -104,7 +369,8 @@ debugging_tips = """
 DEBUGGING TIPS:
 
 1. Use Custom Request IDs:
-   extra_headers={"X-Client-Request-Id": "your-id"}
+   extra_headers={"X-Client-Request-Id": f"req_{uuid.uuid4().hex}"}
+   (never a timestamp - requests in the same second would share it)
 
 2. Log All Requests:
    - Timestamp
@@ -140,3 +406,79 @@ DEBUGGING TIPS:
 """
 
 print(debugging_tips)
+
+
+def benchmark_request_logging(requests=20000):
+    """Request-path cost: open/append/close per entry vs the batched writer"""
+    with tempfile.TemporaryDirectory() as log_dir:
+        entry = {"timestamp": 0.0, "prompt": "What is the capital of France?", "status": "success",
+                 "request_id": "chatcmpl-123", "model": "gpt-5-mini", "tokens": 42}
+
+        path = os.path.join(log_dir, "sync.log")
+        start = time.perf_counter()
+        for _ in range(requests):
+            with open(path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        sync_us = (time.perf_counter() - start) / requests * 1e6
+
+        writer = BatchedLogWriter(os.path.join(log_dir, "batched.log"), max_queue=requests)
+        start = time.perf_counter()
+        for _ in range(requests):
+            writer.submit(dict(entry))
+        batched_us = (time.perf_counter() - start) / requests * 1e6
+        writer.close()
+
+        print(f"open/append/close per request: {sync_us:6.2f} µs")
+        print(f"BatchedLogWriter.submit:       {batched_us:6.2f} µs "
+              f"({writer.stats['written']} written in {writer.stats['batches']} batches)")
+
+
+def benchmark_log_queries(entries=500000):
+    """Tail and filtered queries on a large log: readlines vs reverse seek vs index"""
+    with tempfile.TemporaryDirectory() as log_dir:
+        logger = RequestLogger(os.path.join(log_dir, "api_requests.log"), index=True,
+                               max_queue=entries, max_bytes=None, batch_size=4096)
+        now = time.time()
+        models = ("gpt-5-mini", "gpt-4o", "gpt-4.1")
+        for i in range(entries):
+            model = models[i % 3]
+            failed = i % 50 == 0
+            logger.writer.submit({
+                "timestamp": now - (entries - i) * 0.05,  # ~7 hours of traffic
+                "prompt": f"Summarise support ticket #{i} for the billing team",
+                "status": "error" if failed else "success",
+                "model": model,
+                **({"error_type": "RateLimitError"} if failed else {"request_id": f"chatcmpl-{i}", "tokens": 120 + i % 400}),
+            })
+        logger.writer.flush()
+        size_mb = os.path.getsize(logger.log_file) / 1e6
+
+        def timed(label, func):
+            start = time.perf_counter()
+            result = func()
+            print(f"  {label:<46} {(time.perf_counter() - start) * 1000:8.2f} ms  ({len(result)} entries)")
+
+        def readlines_tail():
+            with open(logger.log_file) as f:
+                return [json.loads(line) for line in f.readlines()[-100:]]
+
+        def full_scan_errors():
+            with open(logger.log_file) as f:
+                matches = [e for e in map(json.loads, f)
+                           if e["model"] == "gpt-4o" and e["status"] == "error" and e["timestamp"] >= now - 3600]
+            return matches[-100:]
+
+        print(f"{entries:,} entries, {size_mb:.0f} MB log")
+        timed("Last 100 - readlines()", readlines_tail)
+        timed("Last 100 - reverse seek", lambda: logger.get_recent_logs(100))
+        timed("Last 100 gpt-4o errors in 1h - full scan", full_scan_errors)
+        timed("Last 100 gpt-4o errors in 1h - index", lambda: logger.query(100, "gpt-4o", "error", now - 3600))
+        os.rename(logger.index_path, logger.index_path + ".off")
+        timed("Last 100 gpt-4o errors in 1h - reverse scan", lambda: logger.query(100, "gpt-4o", "error", now - 3600))
+        logger.writer.close()
+
+
+if __name__ == "__main__":
+    benchmark_request_logging()
+    print()
+    benchmark_log_queries()
@@ -3,118 +3,1400 @@
 """
 
 import os
+import json
+import math
 import time
+import asyncio
+import random
 import hashlib
+import inspect
+import itertools
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from functools import wraps
+import numpy as np
 from dotenv import load_dotenv
-from openai import OpenAI, APIError
+from openai import (
+    OpenAI,
+    AsyncOpenAI,
+    APIError,
+    APIStatusError,
+    APITimeoutError,
+    APIConnectionError,
+    RateLimitError,
+)
 
 load_dotenv()
 client = OpenAI()
 
 
-def with_retry(max_retries=3, base_delay=1):
-    """Decorator for automatic retry with exponential backoff"""
+class RetryBudget:
+    """
+    Cap retries at a fraction of overall traffic.
+
+    Every request deposits `ratio` tokens and every retry spends one, so
+    with ratio=0.1 retries can add at most ~10% load. During an outage
+    this stops clients from multiplying traffic with retry storms.
+    `min_per_second` keeps a trickle of retries available at low volume,
+    and `max_balance` caps the burst saved up while things were healthy;
+    both are kept small so they do not swamp the ratio.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=0.1, max_balance=5.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.balance = min(self.max_balance, self.balance + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill()
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            self._refill()
+            if self.balance >= 1:
+                self.balance -= 1
+                return True
+            return False
+
+
+class RetryPolicy:
+    """
+    One retry policy for every API call.
+
+    - Classifies errors: 429s (except insufficient_quota), 408/409/5xx,
+      timeouts and connection errors are retried; other 4xx are not.
+    - Honours retry-after-ms / retry-after from the server.
+    - Otherwise waits with decorrelated jitter:
+      sleep = min(max_delay, uniform(base, previous * 3)).
+    - Spends from a shared RetryBudget and records retry metrics.
+    - Only repeats what is safe to repeat. Rejections the server never
+      processed (429, 408, 409, failed connects) are always retried.
+      Ambiguous failures - 5xx, timeouts, connections dropped after sending -
+      are retried only when the call sends an Idempotency-Key header
+      (extra_headers) or the policy is created with idempotent=True.
+    """
+
+    RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+    REJECTED_STATUS = {408, 409, 429}                  # Refused before any work was done
+    NOT_SENT = {"ConnectError", "ConnectTimeout"}      # Transport errors raised before the request left
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=20.0,
+                 max_retry_after=60.0, budget=None, idempotent=False):
+        self.max_attempts = max_attempts
+        self.idempotent = idempotent
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget = budget or RetryBudget()
+        self.metrics = {
+            "calls": 0,
+            "retries": 0,
+            "retries_by_reason": {},
+            "gave_up": 0,
+            "budget_exhausted": 0,
+            "non_retryable": 0,
+            "not_idempotent": 0,
+            "sleep_seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    def classify(self, error):
+        """Return (retryable, reason) for an exception"""
+        if isinstance(error, RateLimitError):
+            code = getattr(error, "code", None)
+            if code == "insufficient_quota":
+                return False, "insufficient_quota"  # Billing problem - retrying will not help
+            return True, "rate_limit"
+        if isinstance(error, APITimeoutError):
+            return True, "timeout"
+        if isinstance(error, APIConnectionError):
+            return True, "connection"
+        if isinstance(error, APIStatusError):
+            status = error.status_code
+            return status in self.RETRYABLE_STATUS, f"http_{status}"
+        return False, type(error).__name__
+
+    @staticmethod
+    def retry_after(error):
+        """Server-requested delay in seconds, if any"""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        headers = response.headers
+
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    @classmethod
+    def may_have_been_processed(cls, error):
+        """False only when the server certainly did not act on the request"""
+        if isinstance(error, APIStatusError):
+            return error.status_code not in cls.REJECTED_STATUS
+        if isinstance(error, APIConnectionError):
+            return type(error.__cause__).__name__ not in cls.NOT_SENT
+        return True
+
+    @staticmethod
+    def idempotency_key(kwargs):
+        """The Idempotency-Key header a call sends via extra_headers, if any"""
+        for name, value in (kwargs.get("extra_headers") or {}).items():
+            if name.lower() == "idempotency-key":
+                return value
+        return None
+
+    def _record(self, key, reason=None, sleep=0.0):
+        with self._lock:
+            if reason:
+                by_reason = self.metrics["retries_by_reason"]
+                by_reason[reason] = by_reason.get(reason, 0) + 1
+            self.metrics[key] += 1
+            self.metrics["sleep_seconds"] += sleep
+
+    def call(self, func, *args, **kwargs):
+        """Call func, retrying transient failures according to the policy"""
+        self.budget.record_request()
+        self._record("calls")
+        delay = self.base_delay
+        repeatable = self.idempotent or self.idempotency_key(kwargs) is not None
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except CircuitOpenError:
+                raise  # Not a failed call: nothing was sent
+            except Exception as e:
+                retryable, reason = self.classify(e)
+                if not retryable:
+                    self._record("non_retryable")
+                    raise
+                if not repeatable and self.may_have_been_processed(e):
+                    self._record("not_idempotent")  # A repeat could run the request twice
+                    raise
+                if attempt == self.max_attempts:
+                    self._record("gave_up")
+                    raise
+                if not self.budget.try_spend():
+                    self._record("budget_exhausted")
+                    raise
+
+                delay = min(self.max_delay, random.uniform(self.base_delay, delay * 3))
+                server_delay = self.retry_after(e)
+                if server_delay is not None:
+                    if server_delay > self.max_retry_after:
+                        self._record("gave_up")
+                        raise
+                    delay = max(delay, server_delay)
+
+                self._record("retries", reason=reason, sleep=delay)
+                print(f"Retry {attempt}/{self.max_attempts - 1} after {reason} in {delay:.2f}s")
+                time.sleep(delay)
+
+
+default_retry_policy = RetryPolicy()
+
+
+def with_retry(max_retries=3, base_delay=1, policy=None, idempotent=False):
+    """Decorator for automatic retry with error classification and jittered backoff"""
+    policy = policy or RetryPolicy(
+        max_attempts=max_retries,
+        base_delay=base_delay,
+        budget=default_retry_policy.budget,  # Share one budget across decorated functions
+        idempotent=idempotent
+    )
+
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except APIError as e:
-                    if attempt < max_retries - 1:
-                        wait_time = base_delay * (2 ** attempt)
-                        print(f"Retry {attempt + 1}/{max_retries} in {wait_time}s")
-                        time.sleep(wait_time)
-                    else:
-                        raise
-            return None
+            return policy.call(func, *args, **kwargs)
+        wrapper.retry_policy = policy
         return wrapper
     return decorator
 
 
-def with_caching(cache_duration=3600):
-    """Decorator for caching responses"""
-    cache = {}
+class ResponseCache:
+    """
+    Bounded in-memory response cache with an optional disk tier.
+
+    - LRU eviction by entry count and by total bytes, plus TTL expiry
+    - Keys are a SHA-256 of canonical JSON request parameters, so the same
+      request hits regardless of argument order or which client made it
+    - Single-flight: concurrent misses for one key make a single call and
+      the other callers wait for its result
+    - Optional disk tier (JSON files) that survives restarts
+    """
+
+    def __init__(self, ttl=3600, max_entries=1024, max_bytes=64 * 1024 * 1024, disk_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._entries = OrderedDict()  # key -> (value, expires_at, size), oldest first
+        self._total_bytes = 0
+        self._inflight = {}            # key -> Future of the call in progress
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "disk_hits": 0, "coalesced": 0,
+                        "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def make_key(name, params):
+        """Stable key from a function name and its request parameters"""
+        payload = json.dumps([name, params], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, size = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    return True, value
+                self._remove(key)
+                self.metrics["expirations"] += 1
+
+        found, value, expires_at = self._disk_get(key)
+        if found:
+            with self._lock:
+                self.metrics["disk_hits"] += 1
+                self._store(key, value, expires_at)
+            return True, value
+
+        with self._lock:
+            self.metrics["misses"] += 1
+        return False, None
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        self._disk_put(key, value, expires_at)
+
+    def get_or_call(self, key, func, *args, **kwargs):
+        """Cached value for key, calling func at most once across concurrent misses"""
+        found, value = self.get(key)
+        if found:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            return future.result()  # Re-raises the leader's exception
+
+        try:
+            value = func(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)  # Errors are shared with waiters but never cached
+            raise
+        else:
+            if not getattr(value, "stale", False):  # Fallback answers are served, never cached
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _store(self, key, value, expires_at):
+        size = self._sizeof(value)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires_at, size)
+        self._total_bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.metrics["evictions"] += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._total_bytes -= size
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, str):
+            return len(value.encode("utf-8"))
+        return len(json.dumps(value, default=str))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return False, None, None
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return False, None, None
+        if time.time() >= record["expires_at"]:
+            return False, None, None
+        return True, record["value"], record["expires_at"]
+
+    def _disk_put(self, key, value, expires_at):
+        if not self.disk_dir:
+            return
+        try:
+            payload = json.dumps({"expires_at": expires_at, "value": value})
+        except TypeError:
+            return  # Not JSON-serialisable: keep it in memory only
+        tmp_path = f"{self._disk_path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self._disk_path(key))  # Atomic, so readers never see half a file
+
+    def stats(self):
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["disk_hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hit_rate": round((lookups - self.metrics["misses"]) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def with_caching(cache_duration=3600, max_entries=1024, max_bytes=64 * 1024 * 1024, disk_dir=None):
+    """Decorator for caching responses in a bounded, single-flight ResponseCache"""
+    cache = ResponseCache(ttl=cache_duration, max_entries=max_entries,
+                          max_bytes=max_bytes, disk_dir=disk_dir)
 
     def decorator(func):
+        signature = inspect.signature(func)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Create cache key
-            cache_key = hashlib.md5(
-                f"{func.__name__}:{args}:{kwargs}".encode()
-            ).hexdigest()
-
-            # Check cache
-            if cache_key in cache:
-                cached_value, cached_time = cache[cache_key]
-                if time.time() - cached_time < cache_duration:
-                    print("✅ Returning cached result")
-                    return cached_value
-
-            # Call function
+            # Key on the request parameters, not on `self` itself, so instances share entries -
+            # but only instances with the same `cache_scope` (e.g. the same model chain)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = {name: value for name, value in bound.arguments.items() if name != "self"}
+            if "self" in bound.arguments:
+                params["self"] = getattr(bound.arguments["self"], "cache_scope", None)
+            key = cache.make_key(func.__qualname__, params)
+            return cache.get_or_call(key, func, *args, **kwargs)
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+class _Broadcast:
+    """Chunks of one upstream stream, readable by any number of subscribers"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+
+class RequestCoalescer:
+    """
+    Collapse identical in-flight requests into one API call.
+
+    Requests are identified by a hash of their canonical parameters. The
+    first caller (the leader) makes the call; callers arriving while it is
+    in flight (followers) share its result instead of sending their own.
+
+    Streaming requests are pumped by a background thread into a shared
+    buffer. A follower that joins mid-stream first replays the chunks
+    already received, then continues live with everyone else.
+
+    Unlike a cache, nothing is kept once the call finishes. Coalescing a
+    request with temperature > 0 means all callers get the same sample,
+    which is usually what you want for identical FAQ-style prompts.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or OpenAI(max_retries=0)
+        self._inflight = {}        # key -> Future (non-streaming) or _Broadcast (streaming)
+        self._lock = threading.Lock()
+        self.metrics = {"requests": 0, "upstream_calls": 0, "coalesced": 0,
+                        "stream_requests": 0, "stream_upstream_calls": 0, "stream_coalesced": 0}
+
+    @staticmethod
+    def key(params):
+        return ResponseCache.make_key("chat.completions", params)
+
+    def create_shared(self, **params):
+        """Like chat.completions.create; returns (response, is_leader)"""
+        return self.run_shared(self.key(params), lambda: self.client.chat.completions.create(**params))
+
+    def run_shared(self, key, func):
+        """
+        Run func() once for every concurrent caller with the same key; returns (result, is_leader).
+
+        Followers get the leader's result or exception without running func()
+        themselves, so wrapping a whole retry/fallback chain means breakers and
+        retry budgets see one outcome per shared call.
+        """
+        with self._lock:
+            self.metrics["requests"] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.metrics["upstream_calls"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            return future.result(), False
+
+        try:
+            result = func()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def create(self, **params):
+        return self.create_shared(**params)[0]
+
+    def stream(self, **params):
+        """Like chat.completions.create(stream=True); yields chunks"""
+        return self.stream_shared(**params)[0]
+
+    def stream_shared(self, **params):
+        """Like stream(); returns (chunk iterator, is_leader)"""
+        params = {**params, "stream": True}
+        key = self.key(params)
+        with self._lock:
+            self.metrics["stream_requests"] += 1
+            broadcast = self._inflight.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._inflight[key] = _Broadcast()
+                self.metrics["stream_upstream_calls"] += 1
+                threading.Thread(target=self._pump, args=(key, broadcast, params), daemon=True).start()
+            else:
+                self.metrics["stream_coalesced"] += 1
+        return self._subscribe(broadcast), leader
+
+    def _pump(self, key, broadcast, params):
+        # Read upstream at full speed regardless of how fast any one subscriber consumes
+        try:
+            for chunk in self.client.chat.completions.create(**params):
+                with broadcast.cond:
+                    broadcast.chunks.append(chunk)
+                    broadcast.cond.notify_all()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)  # Later arrivals start a fresh request
+            with broadcast.cond:
+                broadcast.done = True
+                broadcast.cond.notify_all()
+
+    @staticmethod
+    def _subscribe(broadcast):
+        position = 0
+        while True:
+            with broadcast.cond:
+                while position >= len(broadcast.chunks) and not broadcast.done:
+                    broadcast.cond.wait()
+                batch = broadcast.chunks[position:]
+                finished = broadcast.done and position + len(batch) == len(broadcast.chunks)
+            position += len(batch)
+            yield from batch  # Replays everything missed, then live chunks
+            if finished:
+                if broadcast.error:
+                    raise broadcast.error
+                return
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "in_flight": len(self._inflight)}
+
+
+class _SemanticPartition:
+    """Ring buffer of normalised prompt embeddings and their answers"""
+
+    def __init__(self, max_entries, dim):
+        self.matrix = np.zeros((max_entries, dim), dtype=np.float32)
+        self.prompts = [None] * max_entries
+        self.answers = [None] * max_entries
+        self.size = 0
+        self.next = 0
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by meaning rather than exact text.
+
+    Prompts are embedded and compared against every cached prompt with one
+    matrix-vector product over a preallocated, L2-normalised float32 matrix.
+    Above `threshold` cosine similarity, the cached answer is returned.
+    Entries are partitioned by route and request parameters (model chain,
+    temperature, max_tokens, ...), so a paraphrase never gets an answer
+    generated under different settings. When a partition is full, its
+    oldest entry is overwritten (ring buffer).
+
+    Only use it for deterministic routes (FAQ, policy lookups) where a
+    paraphrase should get the same answer. A small sample of hits is kept in
+    `hit_samples` so someone can review them for false hits and tune the
+    threshold.
+    """
+
+    def __init__(self, routes=("faq",), threshold=0.92, max_entries=10000,
+                 embedding_model="text-embedding-3-small", embed=None, sample_rate=0.02):
+        self.routes = set(routes)
+        self.threshold = threshold
+        self.max_entries = max_entries          # Per partition
+        self.embedding_model = embedding_model
+        self.embed = embed or self._embed
+        self.sample_rate = sample_rate
+
+        self._partitions = {}                   # make_key(route, params) -> _SemanticPartition
+        self._lock = threading.Lock()
+
+        self.metrics = {"lookups": 0, "hits": 0, "skipped_routes": 0}
+        self.search_ms = deque(maxlen=10000)    # Matrix search only
+        self.lookup_ms = deque(maxlen=10000)    # Whole lookup, including the embedding call
+        self.hit_samples = deque(maxlen=200)    # (prompt, matched prompt, score) for review
+
+    def _embed(self, text):
+        response = client.embeddings.create(input=[text.replace("\n", " ")], model=self.embedding_model)
+        return np.array(response.data[0].embedding, dtype=np.float32)
+
+    def _vector(self, prompt):
+        vector = np.asarray(self.embed(prompt), dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def enabled_for(self, route):
+        return route in self.routes
+
+    def lookup(self, prompt, route, params=None):
+        """Return (answer or None, embedding); embedding is reused by store()"""
+        if not self.enabled_for(route):
+            with self._lock:
+                self.metrics["skipped_routes"] += 1
+            return None, None
+
+        start = time.perf_counter()
+        vector = self._vector(prompt)
+        key = ResponseCache.make_key(route, params or {})
+
+        with self._lock:
+            self.metrics["lookups"] += 1
+            partition = self._partitions.get(key)
+            if partition is None or not partition.size:
+                self.lookup_ms.append((time.perf_counter() - start) * 1000)
+                return None, vector
+            search_start = time.perf_counter()
+            scores = partition.matrix[:partition.size] @ vector
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            now = time.perf_counter()
+            self.search_ms.append((now - search_start) * 1000)
+            self.lookup_ms.append((now - start) * 1000)
+            if score < self.threshold:
+                return None, vector
+            matched_prompt, answer = partition.prompts[best], partition.answers[best]
+            self.metrics["hits"] += 1
+            if random.random() < self.sample_rate:
+                self.hit_samples.append((prompt, matched_prompt, round(score, 4)))
+        return answer, vector
+
+    def store(self, prompt, answer, route, vector=None, params=None):
+        if not self.enabled_for(route):
+            return
+        if vector is None:
+            vector = self._vector(prompt)
+        key = ResponseCache.make_key(route, params or {})
+
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _SemanticPartition(self.max_entries, len(vector))
+            slot = partition.next
+            partition.matrix[slot] = vector
+            partition.prompts[slot] = prompt
+            partition.answers[slot] = answer
+            partition.next = (slot + 1) % self.max_entries
+            partition.size = min(partition.size + 1, self.max_entries)
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            searches = sorted(self.search_ms)
+            lookups_ms = sorted(self.lookup_ms)
+            entries = sum(partition.size for partition in self._partitions.values())
+            partitions = len(self._partitions)
+        pct = lambda values, p: round(values[min(len(values) - 1, int(len(values) * p))], 3) if values else None
+        lookups = metrics["lookups"]
+        return {
+            **metrics,
+            "entries": entries,
+            "partitions": partitions,
+            "hit_rate": round(metrics["hits"] / lookups, 3) if lookups else 0.0,
+            "p50_lookup_ms": pct(lookups_ms, 0.50),
+            "p99_lookup_ms": pct(lookups_ms, 0.99),
+            "p50_search_ms": pct(searches, 0.50),
+            "p99_search_ms": pct(searches, 0.99),
+            "hit_samples": len(self.hit_samples),
+        }
+
+
+class CircuitOpenError(Exception):
+    """Raised immediately when a circuit is open instead of waiting on a failing endpoint"""
+
+
+class StaleAnswer(str):
+    """An earlier answer served because every model was unavailable; check `answer.stale`"""
+
+    stale = True
+
+
+class CircuitBreaker:
+    """
+    Stop calling an endpoint that keeps failing.
+
+    - closed: calls go through; `failure_threshold` consecutive failures open it
+    - open: calls fail fast with CircuitOpenError for `recovery_timeout` seconds
+    - half_open: up to `half_open_max_calls` probe requests are let through;
+      a success closes the circuit, a failure re-opens it with the timeout
+      doubled (up to `max_recovery_timeout`)
+
+    Only transient errors count as failures - a 400 is the caller's fault and
+    says nothing about the endpoint's health.
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0,
+                 max_recovery_timeout=300.0, half_open_max_calls=1, is_failure=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_recovery_timeout = recovery_timeout
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure or (lambda e: default_retry_policy.classify(e)[0])
+
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go out now"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self.probes_in_flight = 0
+
+            if self.state == "half_open":
+                if self.probes_in_flight >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.probes_in_flight += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probes_in_flight = 0
+            self.recovery_timeout = self.base_recovery_timeout
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == "half_open":
+                # The probe failed: back off harder before the next one
+                self.recovery_timeout = min(self.max_recovery_timeout, self.recovery_timeout * 2)
+                self._open()
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        print(f"⚡ Circuit '{self.name}' opened for {self.recovery_timeout:.0f}s")
+
+    def call(self, func, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        try:
             result = func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()  # The endpoint answered; the request was bad
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class HedgedRequester:
+    """
+    Race a backup request against a slow one to cut tail latency.
+
+    The first attempt starts immediately. If it has not finished by the
+    `percentile` of recently observed latencies (p95 by default), a second,
+    identical attempt is started and whichever finishes first wins; the other
+    is cancelled. Only the slowest ~5% of requests are hedged, so extra load
+    stays small, and a RetryBudget caps it during incidents when everything
+    is slow and hedging would only add load.
+    """
 
-            # Cache result
-            cache[cache_key] = (result, time.time())
+    def __init__(self, percentile=0.95, min_samples=20, budget=None):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = budget or RetryBudget(ratio=0.05, min_per_second=0.2, max_balance=5)
+        self.samples = {}                     # key -> recent attempt latencies
+        self.latencies = deque(maxlen=10000)  # End-to-end latency of every request
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0}
 
+    def hedge_delay(self, key):
+        samples = sorted(self.samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None  # Not enough history to know what "slow" means yet
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile))]
+
+    def _observe(self, key, latency):
+        self.samples.setdefault(key, deque(maxlen=1000)).append(latency)
+
+    async def run(self, key, attempt, discard=None):
+        """
+        Await attempt(), hedging with a second attempt() if it is slow.
+
+        `discard` is awaited with the result of an attempt that finished but
+        lost the race (e.g. to close its stream). Returns (result, hedged, backup_won).
+        """
+        start = time.monotonic()
+        self.stats["requests"] += 1
+        self.budget.record_request()
+
+        async def timed(censor=False):
+            attempt_start = time.monotonic()
+            try:
+                result = await attempt()
+            except asyncio.CancelledError:
+                if censor:
+                    # A slow primary that lost the race still tells us it took at least
+                    # this long; dropping it would skew the samples (and p95) low.
+                    self._observe(key, time.monotonic() - attempt_start)
+                raise
+            self._observe(key, time.monotonic() - attempt_start)
             return result
-        return wrapper
-    return decorator
+
+        primary = asyncio.create_task(timed(censor=True))
+        tasks = [primary]
+        delay = self.hedge_delay(key)
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if self.budget.try_spend():
+                    tasks.append(asyncio.create_task(timed()))
+                    self.stats["hedged"] += 1
+                else:
+                    self.stats["budget_denied"] += 1
+
+        winner, error = None, None
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task
+                elif discard:
+                    await discard(task.result())  # Both finished at once
+
+        for task in pending:
+            task.cancel()  # attempt() is expected to close its own stream on cancellation
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if winner is None:
+            raise error
+        self.latencies.append(time.monotonic() - start)
+        backup_won = winner is not primary
+        self.stats["hedge_wins"] += backup_won
+        return winner.result(), len(tasks) > 1, backup_won
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        pct = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+        requests = self.stats["requests"] or 1
+        return {
+            **self.stats,
+            "hedge_rate": round(self.stats["hedged"] / requests, 3),
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+        }
+
+
+class StreamingHistogram:
+    """
+    Log-bucketed histogram with a fixed relative error (HDR/DDSketch style).
+
+    A value lands in bucket ceil(log(value) / log(gamma)), so every quantile
+    is accurate to within `relative_error`. Memory depends on the range of
+    values seen (about 350 buckets span 1 ms to 1 hour at 2%), never on how
+    many were recorded.
+    """
+
+    ZERO_BUCKET = -(10**9)  # Values <= 0 (e.g. zero tokens)
+
+    def __init__(self, relative_error=0.02):
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value):
+        key = math.ceil(math.log(value) / self.log_gamma) if value > 0 else self.ZERO_BUCKET
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+
+    def quantiles(self, qs=(0.50, 0.95, 0.99)):
+        """Values at each quantile in one pass over the sorted buckets"""
+        if not self.count:
+            return [None] * len(qs)
+        ranks = [q * (self.count - 1) for q in qs]
+        results = [None] * len(qs)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            for i, rank in enumerate(ranks):
+                if results[i] is None and seen > rank:
+                    results[i] = 0.0 if key == self.ZERO_BUCKET else 2 * self.gamma ** key / (self.gamma + 1)
+        return results
+
+
+class RollingUsageStats:
+    """
+    Request, error, token and latency stats per (model, route) in constant memory.
+
+    Time is split into `slot_seconds` slots kept in a ring covering
+    `window_seconds`; each slot holds counters plus latency and token
+    histograms. A snapshot merges at most window/slot histograms, so its
+    cost is fixed by configuration, not by how much traffic was recorded.
+    All-time counters are kept alongside.
+    """
+
+    def __init__(self, window_seconds=600, slot_seconds=10, relative_error=0.02):
+        self.window_seconds = window_seconds
+        self.slot_seconds = slot_seconds
+        self.relative_error = relative_error
+        self.slots = deque(maxlen=window_seconds // slot_seconds)  # (slot start, {key: stats})
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def _new_stats(self):
+        return {
+            "requests": 0,
+            "errors": 0,
+            "tokens": 0,
+            "latency_ms": StreamingHistogram(self.relative_error),
+            "tokens_per_request": StreamingHistogram(self.relative_error),
+        }
+
+    def record(self, model, latency_ms, tokens=0, route=None, error=False):
+        key = (model, route)
+        slot_start = int(time.time() // self.slot_seconds) * self.slot_seconds
+        with self._lock:
+            if not self.slots or self.slots[-1][0] != slot_start:
+                self.slots.append((slot_start, {}))  # The oldest slot falls off the ring
+            for stats in (self.slots[-1][1].setdefault(key, self._new_stats()),
+                          self.totals.setdefault(key, {"requests": 0, "errors": 0, "tokens": 0})):
+                stats["requests"] += 1
+                stats["errors"] += error
+                stats["tokens"] += tokens
+                if "latency_ms" in stats:
+                    stats["latency_ms"].record(latency_ms)
+                    if not error:
+                        stats["tokens_per_request"].record(tokens)
+
+    def snapshot(self, window_seconds=None, model=None, route=None):
+        """Counters and p50/p95/p99 over the last window, optionally for one model/route"""
+        since = time.time() - (window_seconds or self.window_seconds)
+        merged = self._new_stats()
+        with self._lock:
+            for slot_start, slot in self.slots:
+                if slot_start + self.slot_seconds <= since:
+                    continue
+                for (slot_model, slot_route), stats in slot.items():
+                    if (model and slot_model != model) or (route and slot_route != route):
+                        continue
+                    for name in ("requests", "errors", "tokens"):
+                        merged[name] += stats[name]
+                    merged["latency_ms"].merge(stats["latency_ms"])
+                    merged["tokens_per_request"].merge(stats["tokens_per_request"])
+
+        p50, p95, p99 = merged["latency_ms"].quantiles()
+        round_or_none = lambda value: round(value, 1) if value is not None else None
+        requests = merged["requests"]
+        return {
+            "requests": requests,
+            "errors": merged["errors"],
+            "error_rate": round(merged["errors"] / requests, 4) if requests else 0.0,
+            "tokens": merged["tokens"],
+            "latency_p50_ms": round_or_none(p50),
+            "latency_p95_ms": round_or_none(p95),
+            "latency_p99_ms": round_or_none(p99),
+            "tokens_p95": round_or_none(merged["tokens_per_request"].quantiles((0.95,))[0]),
+        }
+
+    def total(self, name="tokens"):
+        with self._lock:
+            return sum(stats[name] for stats in self.totals.values())
 
 
 class ProductionAPIClient:
     """Production-ready API client with best practices"""
 
-    def __init__(self):
-        self.client = OpenAI()
-        self.request_log = []
+    def __init__(self, models=("gpt-5-mini", "gpt-4o"), retry_policy=None, max_stale_answers=1000,
+                 hedge=False, hedge_percentile=0.95, semantic_cache=None):
+        # Retries are handled by RetryPolicy; disable the SDK's own so they do not multiply
+        self.client = OpenAI(max_retries=0)
+        self.async_client = None                  # Created with the hedging event loop on first use
+        self._hedge_loop = None
+        self._hedge_lock = threading.Lock()
+        self.coalescer = RequestCoalescer(self.client)
+        self.usage = RollingUsageStats()          # Constant-memory usage stats per model/route
+        self.models = list(models)                # Fallback chain, tried in order
+        self.retry_policy = retry_policy or default_retry_policy
+        self.breakers = {}                        # (model, endpoint) -> CircuitBreaker
+        self._breakers_lock = threading.Lock()
+        self.stale_answers = OrderedDict()        # Last good answer per request, final fallback
+        self.max_stale_answers = max_stale_answers
+        self.hedge = hedge                        # Opt-in: only for short, latency-critical calls
+        self.hedger = HedgedRequester(percentile=hedge_percentile)
+        self.hedge_extra_tokens = 0               # Estimated tokens spent on losing attempts
+        self.semantic_cache = semantic_cache      # Optional SemanticCache for deterministic routes
 
-    @with_retry(max_retries=3)
-    @with_caching(cache_duration=3600)
-    def make_request(self, prompt, **kwargs):
-        """Make API request with retry and caching"""
+    @property
+    def cache_scope(self):
+        """Instance settings that change answers, added to make_request's cache key"""
+        return {"models": self.models}
+
+    def breaker(self, model, endpoint="chat.completions"):
+        key = (model, endpoint)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self.breakers.setdefault(key, CircuitBreaker(f"{model}/{endpoint}"))
+        return breaker
+
+    def _complete(self, model, prompt, **kwargs):
         response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            **kwargs
+        )
+        return response.choices[0].message.content, response.usage.total_tokens
+
+    @with_caching(cache_duration=3600)
+    def make_request(self, prompt, route=None, **kwargs):
+        """
+        Make API request with retries, circuit breakers and fallbacks.
+
+        Each model in the chain is tried behind its own circuit breaker; an
+        open circuit is skipped instantly. If every model is unavailable, the
+        last good answer for the same request is returned as a StaleAnswer
+        (a str with .stale = True), and is not cached.
+        Requests on a semantic-cache route can be answered by a paraphrase.
+        """
+        vector = None
+        semantic_params = {"models": self.models, **kwargs}   # Answers are only shared under the same settings
+        if self.semantic_cache and route:
+            answer, vector = self.semantic_cache.lookup(prompt, route, semantic_params)
+            if answer is not None:
+                return answer
+
+        stale_key = hashlib.sha256(repr((prompt, sorted(kwargs.items()))).encode()).hexdigest()
+        # No coalescing here: @with_caching's single-flight already lets only one of several
+        # identical in-flight calls reach the fallback chain, so breakers and the retry
+        # budget see its outcome once, not once per caller
+        answer, last_error = self._first_available(self.models, self._complete, prompt, route=route, **kwargs)
+
+        if last_error is None:
+            if self.semantic_cache and route:
+                self.semantic_cache.store(prompt, answer, route, vector, semantic_params)
+            self.stale_answers[stale_key] = answer
+            self.stale_answers.move_to_end(stale_key)
+            if len(self.stale_answers) > self.max_stale_answers:
+                self.stale_answers.popitem(last=False)
+            return answer
+
+        if stale_key in self.stale_answers:
+            print("⚠️ All models unavailable - serving last known answer")
+            return StaleAnswer(self.stale_answers[stale_key])
+        raise last_error
+
+    def _first_available(self, models, call, *args, route=None, **kwargs):
+        """
+        call(model, *args, **kwargs) on each model in turn, behind its breaker and the retry policy.
+
+        call returns (answer, tokens). Returns (answer, None), or (None, last error)
+        when every model is unavailable. The whole pass - retries and fallbacks
+        included - is recorded in self.usage as one request.
+        """
+        start = time.monotonic()
+        last_error = None
+        request_id = uuid.uuid4().hex
+        for model in models:
+            breaker = self.breaker(model)
+            # Retries of this model resend the same key, so the server can drop duplicates
+            headers = {"Idempotency-Key": f"{request_id}-{model}", **(kwargs.get("extra_headers") or {})}
+            try:
+                # CircuitOpenError is not retryable, so an open circuit moves straight on
+                answer, tokens = self.retry_policy.call(breaker.call, call, model, *args,
+                                                        **{**kwargs, "extra_headers": headers})
+            except (CircuitOpenError, APIError) as e:
+                if isinstance(e, APIStatusError) and not breaker.is_failure(e):
+                    self.usage.record(model, (time.monotonic() - start) * 1000, route=route, error=True)
+                    raise  # A bad request fails on every model
+                print(f"↪️ {model} unavailable ({type(e).__name__}), falling back")
+                last_error = e
+                continue
+            self.usage.record(model, (time.monotonic() - start) * 1000, tokens=tokens, route=route)
+            return answer, None
+        self.usage.record(models[-1], (time.monotonic() - start) * 1000, route=route, error=True)
+        return None, last_error
+
+    def make_request_hedged(self, prompt, model=None, **kwargs):
+        """
+        Streaming request hedged on time to first token.
+
+        The race ends at the first token: the losing stream is cancelled
+        before it generates much, so the extra spend is mostly its prompt.
+        Like make_request(), each model sits behind its circuit breaker and
+        the retry policy, and the fallback chain is used unless `model` is given.
+        Falls back to make_request() unless the client was created with hedge=True.
+        """
+        if not self.hedge:
+            return self.make_request(prompt, **kwargs)
+        answer, error = self._first_available([model] if model else self.models, self._hedged_call, prompt, **kwargs)
+        if error is not None:
+            raise error
+        return answer
+
+    def _hedged_call(self, model, prompt, **kwargs):
+        # One long-lived loop: the async client's connections belong to the loop that opened them,
+        # so a fresh asyncio.run() per call would leave it bound to a closed loop
+        with self._hedge_lock:
+            if self._hedge_loop is None:
+                self._hedge_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._hedge_loop.run_forever, daemon=True).start()
+                self.async_client = AsyncOpenAI(max_retries=0)
+        future = asyncio.run_coroutine_threadsafe(self._hedged_stream(prompt, model, **kwargs), self._hedge_loop)
+        return future.result()
+
+    def close(self):
+        """Close HTTP connections and stop the hedging event loop"""
+        with self._hedge_lock:
+            if self._hedge_loop is not None:
+                asyncio.run_coroutine_threadsafe(self.async_client.close(), self._hedge_loop).result()
+                self._hedge_loop.call_soon_threadsafe(self._hedge_loop.stop)
+                self._hedge_loop = self.async_client = None
+        self.client.close()
+
+    async def _hedged_stream(self, prompt, model, **kwargs):
+        prompt_tokens = len(prompt) // 4  # Rough estimate; a cancelled stream reports no usage
+        headers = kwargs.pop("extra_headers", None) or {}
+        attempts = itertools.count(1)
+
+        async def first_token():
+            # The hedge is a second, concurrent request, not a replay of the first: give
+            # each attempt its own key so the server doesn't collapse it into the slow one.
+            attempt_headers = dict(headers)
+            n = next(attempts)
+            for name, value in headers.items():
+                if name.lower() == "idempotency-key":
+                    attempt_headers[name] = f"{value}-h{n}"
+            stream = None
+            try:
+                stream = await self.async_client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    extra_headers=attempt_headers,
+                    **kwargs
+                )
+                chunks = []
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        return stream, chunks
+                return stream, chunks
+            except asyncio.CancelledError:
+                if stream is not None:
+                    await stream.close()  # Lost the race: release its connection instead of leaving it open
+                raise
+
+        async def discard(result):
+            stream, _ = result
+            await stream.close()
+
+        (stream, chunks), hedged, _ = await self.hedger.run(model, first_token, discard)
+        if hedged:
+            # The loser was stopped around its first token: it cost about its prompt
+            self.hedge_extra_tokens += prompt_tokens + 1
+
+        parts, tokens = [], 0
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        async for chunk in stream:  # Resumes where first_token() stopped
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            if chunk.usage:
+                tokens = chunk.usage.total_tokens
+
+        return "".join(parts), tokens
+
+    def hedge_report(self):
+        """Hedging effect: hedge rate, latency percentiles and estimated extra tokens"""
+        report = self.hedger.report()
+        total_tokens = self.usage.total("tokens") or 1
+        report["extra_tokens_est"] = self.hedge_extra_tokens
+        report["extra_token_pct"] = round(100 * self.hedge_extra_tokens / total_tokens, 2)
+        return report
+
+    def stream_request(self, prompt, model=None, route=None, **kwargs):
+        """Stream a completion; identical concurrent streams share one upstream request"""
+        model = model or self.models[0]
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        start = time.monotonic()
+        chunks, leader = self.coalescer.stream_shared(
+            model=model,
             messages=[{"role": "user", "content": prompt}],
             **kwargs
         )
+        tokens, error = 0, False
+        try:
+            for chunk in chunks:
+                if chunk.usage:
+                    tokens = chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            error = True
+            raise
+        finally:
+            if leader:  # Once per upstream stream, like make_request
+                self.usage.record(model, (time.monotonic() - start) * 1000, tokens=tokens,
+                                  route=route, error=error)
 
-        # Log request
-        self.request_log.append({
-            "timestamp": time.time(),
-            "tokens": response.usage.total_tokens,
-            "model": response.model
-        })
+    def cache_stats(self):
+        return self.make_request.cache.stats()
 
-        return response.choices[0].message.content
+    def circuit_status(self):
+        return {breaker.name: breaker.stats() for breaker in self.breakers.values()}
 
-    def get_usage_stats(self):
-        """Get usage statistics"""
-        if not self.request_log:
-            return {"total_requests": 0, "total_tokens": 0}
+    def get_usage_stats(self, window_seconds=None, model=None, route=None):
+        """Get usage statistics for the rolling window (all-time totals included)"""
+        stats = self.usage.snapshot(window_seconds, model=model, route=route)
+        stats["total_requests"] = self.usage.total("requests")
+        stats["total_tokens"] = self.usage.total("tokens")
+        stats["avg_tokens"] = stats["total_tokens"] / stats["total_requests"] if stats["total_requests"] else 0
+        return stats
 
-        return {
-            "total_requests": len(self.request_log),
-            "total_tokens": sum(log["tokens"] for log in self.request_log),
-            "avg_tokens": sum(log["tokens"] for log in self.request_log) / len(self.request_log)
-        }
+
+def benchmark_usage_stats(requests=200000):
+    """Offline: record/snapshot cost and memory versus an ever-growing request log"""
+    usage = RollingUsageStats()
+    request_log = []
+    models = ("gpt-5-mini", "gpt-4o")
+    samples = [(models[i % 2], random.lognormvariate(6, 0.5), random.randint(50, 2000)) for i in range(requests)]
+
+    start = time.perf_counter()
+    for model, latency, tokens in samples:
+        usage.record(model, latency, tokens=tokens, route="chat")
+    record_us = (time.perf_counter() - start) / requests * 1e6
+
+    start = time.perf_counter()
+    snapshot = usage.snapshot()
+    snapshot_ms = (time.perf_counter() - start) * 1000
+
+    for model, latency, tokens in samples:
+        request_log.append({"timestamp": time.time(), "tokens": tokens, "model": model})
+    start = time.perf_counter()
+    sum(log["tokens"] for log in request_log) / len(request_log)
+    log_ms = (time.perf_counter() - start) * 1000
+
+    buckets = sum(len(stats["latency_ms"].buckets) for _, slot in usage.slots for stats in slot.values())
+    print(f"{requests:,} requests: record {record_us:.2f} µs each, snapshot {snapshot_ms:.2f} ms, "
+          f"{buckets} histogram buckets held")
+    print(f"Unbounded request_log: {len(request_log):,} dicts held, re-sum {log_ms:.1f} ms per get_usage_stats")
+    print(f"p50/p95/p99 latency: {snapshot['latency_p50_ms']} / {snapshot['latency_p95_ms']} / "
+          f"{snapshot['latency_p99_ms']} ms")
+
+
+def demonstrate_coalescing(callers=50):
+    """Offline: many concurrent callers asking the same FAQ question"""
+
+    def fake_chunk(text):
+        delta = type("Delta", (), {"content": text})()
+        return type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})()]})()
+
+    def fake_stream(text):
+        for word in text.split():
+            time.sleep(0.02)
+            yield fake_chunk(word + " ")
+
+    class FakeCompletions:
+        def create(self, stream=False, **params):
+            time.sleep(0.2)
+            answer = "Refunds are accepted within 30 days."
+            return fake_stream(answer) if stream else answer
+
+    fake_client = type("FakeClient", (), {})()
+    fake_client.chat = type("Chat", (), {"completions": FakeCompletions()})()
+    coalescer = RequestCoalescer(fake_client)
+    params = {"model": "gpt-5-mini", "messages": [{"role": "user", "content": "How do refunds work?"}]}
+
+    def stream_text(delay):
+        time.sleep(delay)  # Followers join mid-stream and replay what they missed
+        return "".join(chunk.choices[0].delta.content for chunk in coalescer.stream(**params))
+
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        answers = set(pool.map(lambda _: coalescer.create(**params), range(callers)))
+        streamed = set(pool.map(stream_text, [i * 0.005 for i in range(callers)]))
+
+    stats = coalescer.stats()
+    print(f"{callers} identical requests -> {stats['upstream_calls']} API call, answers: {answers}")
+    print(f"{callers} identical streams  -> {stats['stream_upstream_calls']} API call, "
+          f"all received the full text: {len(streamed) == 1}")
+
+
+def benchmark_semantic_lookup(dim=1536, sizes=(1000, 10000, 50000), queries=200):
+    """Offline: lookup latency of the vectorised index against a per-row loop"""
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        cache = SemanticCache(max_entries=size, embed=lambda text: rng.standard_normal(dim))
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        partition = _SemanticPartition(size, dim)
+        partition.matrix, partition.size = vectors, size
+        cache._partitions[ResponseCache.make_key("faq", {})] = partition
+        for _ in range(queries):
+            cache.lookup("query", "faq")
+
+        # The per-row approach from 01_embeddings.py's cosine_similarity
+        query = vectors[0]
+        start = time.perf_counter()
+        max(range(size), key=lambda i: np.dot(vectors[i], query) / (np.linalg.norm(vectors[i]) * np.linalg.norm(query)))
+        loop_ms = (time.perf_counter() - start) * 1000
+
+        stats = cache.stats()
+        print(f"{size:>6} entries  matrix p50 {stats['p50_search_ms']:>7} ms  p99 {stats['p99_search_ms']:>7} ms  "
+              f"per-row loop {loop_ms:,.1f} ms")
+
+
+def simulate_hedging(requests=2000, concurrency=50):
+    """Offline: the same long-tailed latency distribution with and without hedging"""
+
+    async def fake_attempt():
+        # ~97% of requests take 40-60ms; the rest hit a slow replica at 300-600ms
+        slow = random.random() < 0.03
+        await asyncio.sleep(random.uniform(0.3, 0.6) if slow else random.uniform(0.04, 0.06))
+        return "ok"
+
+    async def run(hedge):
+        budget = RetryBudget(ratio=0.1, min_per_second=0, max_balance=5 if hedge else 0)
+        hedger = HedgedRequester(budget=budget)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                await hedger.run("sim", fake_attempt)
+
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return hedger.report()
+
+    for hedge in (False, True):
+        report = asyncio.run(run(hedge))
+        label = "Hedged at p95" if hedge else "No hedging"
+        print(f"{label:<14} p50 {report['p50_ms']:>6} ms  p99 {report['p99_ms']:>6} ms  "
+              f"extra requests {report['hedge_rate']:.1%}  backup wins {report['hedge_wins']}")
 
 
 best_practices_summary = """
 PRODUCTION BEST PRACTICES SUMMARY:
 
 1. ERROR HANDLING:
-   ✅ Implement retry logic with exponential backoff
+   ✅ Implement retry logic with jittered backoff
+   ✅ Honour retry-after and cap retries with a budget
    ✅ Handle specific exception types
    ✅ Log errors with context
    ✅ Provide fallback responses
 
 2. PERFORMANCE:
    ✅ Cache common responses
+   ✅ Cache paraphrases on deterministic routes
    ✅ Use appropriate models (don't over-provision)
    ✅ Set reasonable timeouts
+   ✅ Hedge latency-critical calls (within a budget)
    ✅ Implement request batching
+   ✅ Coalesce identical in-flight requests
 
 3. MONITORING:
    ✅ Track token usage
@@ -152,3 +1434,20 @@ PRODUCTION BEST PRACTICES SUMMARY:
 """
 
 print(best_practices_summary)
+
+if __name__ == "__main__":
+    print("\n🏁 HEDGED REQUESTS - offline simulation")
+    print("="*60)
+    simulate_hedging()
+
+    print("\n🔗 REQUEST COALESCING - offline simulation")
+    print("="*60)
+    demonstrate_coalescing()
+
+    print("\n📊 ROLLING USAGE STATS")
+    print("="*60)
+    benchmark_usage_stats()
+
+    print("\n🧠 SEMANTIC CACHE - lookup latency (1536-dim embeddings)")
+    print("="*60)
+    benchmark_semantic_lookup()
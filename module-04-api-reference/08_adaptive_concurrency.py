@@ -0,0 +1,249 @@
+"""
+08_adaptive_concurrency.py - Find the sustainable request rate automatically (AIMD)
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from openai import OpenAI, RateLimitError
+
+load_dotenv()
+client = OpenAI()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit in-flight requests with Additive Increase / Multiplicative Decrease.
+
+    The same idea TCP uses for congestion control:
+    - every healthy completion nudges the limit up, by about +1 per "round"
+      of `limit` completions
+    - a 429, another failure or a latency spike cuts the limit by `backoff`
+      (at most once per cooldown, so one burst of errors counts as one signal)
+
+    The latency baseline is the minimum latency seen over the last
+    `baseline_window` seconds (the min-RTT idea from TCP Vegas and
+    Netflix's Gradient limiter). Overload does not raise it, because
+    cutting the limit brings fast samples back. A permanent change in
+    latency (a slower model, a longer prompt mix) becomes the new
+    baseline once the window has rolled over. The limit does not stay
+    pinned at `min_limit`.
+
+    The limit settles just under the point where the API starts throttling,
+    without anyone having to tune a concurrency number by hand.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+                 backoff=0.5, latency_tolerance=2.0, baseline_window=10.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.baseline_window = baseline_window
+
+        self.in_flight = 0
+        self.baseline_latency = None   # Minimum successful latency over the window
+        self._window = deque()         # (time, latency), latencies increasing - front is the minimum
+        self.last_decrease = 0.0
+
+        self.completed = 0
+        self.throttled = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.history = []              # (seconds since start, limit) on every change
+
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until there is room under the current limit"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency, throttled=False, failed=False):
+        """Report how a request went and adjust the limit"""
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            now = time.monotonic()
+
+            if throttled or failed:
+                self.throttled += throttled
+                self.failed += failed
+                self._decrease(now)
+            else:
+                self._observe(latency, now)
+                if latency > self.baseline_latency * self.latency_tolerance:
+                    self._decrease(now)
+                else:
+                    # Additive increase: about +1 after a full window of successes
+                    self._set_limit(self.limit + 1 / self.limit)
+
+            self._cond.notify_all()
+
+    def _observe(self, latency, now):
+        """Add a sample to the windowed minimum (amortised O(1))"""
+        while self._window and self._window[-1][1] >= latency:
+            self._window.pop()
+        self._window.append((now, latency))
+        while self._window[0][0] < now - self.baseline_window:
+            self._window.popleft()
+        self.baseline_latency = self._window[0][1]
+
+    def _decrease(self, now):
+        cooldown = self.baseline_latency or 1.0
+        if now - self.last_decrease >= cooldown:
+            self.last_decrease = now
+            self._set_limit(self.limit * self.backoff)
+
+    def _set_limit(self, value):
+        new_limit = max(self.min_limit, min(self.max_limit, value))
+        if int(new_limit) != int(self.limit):
+            self.history.append((round(time.monotonic() - self.started_at, 2), int(new_limit)))
+        self.limit = new_limit
+
+    @contextmanager
+    def slot(self):
+        """with limiter.slot(): ... - measures latency; 429s count as throttling, other errors as failures"""
+        self.acquire()
+        start = time.monotonic()
+        throttled = failed = False
+        try:
+            yield
+        except RateLimitError:
+            throttled = True
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(time.monotonic() - start, throttled=throttled, failed=failed)
+
+    def call(self, func, *args, **kwargs):
+        """Run any client call under the limiter, e.g. limiter.call(client.chat.completions.create, ...)"""
+        with self.slot():
+            return func(*args, **kwargs)
+
+    def wrap(self, func):
+        """Decorator form of call()"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "throttle_rate": round(self.throttled / self.completed, 3) if self.completed else 0.0,
+            "failure_rate": round(self.failed / self.completed, 3) if self.completed else 0.0,
+            "throughput_rps": round(self.completed / elapsed, 1) if elapsed else 0.0,
+            "baseline_latency_ms": round((self.baseline_latency or 0) * 1000, 1),
+        }
+
+
+limiter = AdaptiveConcurrencyLimiter()
+
+
+@limiter.wrap
+def adaptive_completion(prompt, model="gpt-5-mini"):
+    """Chat completion whose concurrency is managed by the shared limiter"""
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content
+
+
+class SimulatedThrottle(Exception):
+    """Stands in for RateLimitError in the offline simulation"""
+
+
+class SimulatedAPI:
+    """A backend that serves `capacity` concurrent requests well, then degrades"""
+
+    def __init__(self, capacity=12, base_latency=0.05):
+        self.capacity = capacity
+        self.base_latency = base_latency
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def request(self):
+        with self.lock:
+            self.active += 1
+            load = self.active
+        try:
+            if load > self.capacity * 1.5:
+                time.sleep(0.005)
+                raise SimulatedThrottle()
+            # Queueing delay grows once we exceed capacity
+            overload = max(0, load - self.capacity)
+            time.sleep(self.base_latency * (1 + overload) * random.uniform(0.9, 1.1))
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def run_simulation(total_requests=400, workers=64, fixed_limit=None):
+    """Push requests at a simulated API with either AIMD or a fixed concurrency"""
+    api = SimulatedAPI()
+    aimd = AdaptiveConcurrencyLimiter(initial_limit=fixed_limit or 2, max_limit=64)
+    if fixed_limit:
+        aimd.min_limit = aimd.max_limit = fixed_limit
+    failures = 0
+    failures_lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal failures
+        aimd.acquire()
+        start = time.monotonic()
+        throttled = False
+        try:
+            api.request()
+        except SimulatedThrottle:
+            throttled = True
+            with failures_lock:
+                failures += 1
+        finally:
+            aimd.release(time.monotonic() - start, throttled=throttled)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one_request, range(total_requests)))
+    elapsed = time.monotonic() - start
+
+    return {
+        "mode": f"fixed={fixed_limit}" if fixed_limit else "AIMD",
+        "elapsed_s": round(elapsed, 2),
+        "good_rps": round((total_requests - failures) / elapsed, 1),
+        "throttled": failures,
+        "final_limit": int(aimd.limit),
+        "history": aimd.history[-8:],
+    }
+
+
+def main():
+    print("📈 ADAPTIVE CONCURRENCY (AIMD) - offline simulation")
+    print("="*60)
+    print("Simulated API: healthy up to 12 in-flight, throttles above 18\n")
+
+    for fixed_limit in (4, 64, None):
+        result = run_simulation(fixed_limit=fixed_limit)
+        print(f"{result['mode']:<10} {result['elapsed_s']:>6}s  "
+              f"{result['good_rps']:>6} good req/s  {result['throttled']:>4} throttled  "
+              f"final limit {result['final_limit']}")
+        if not fixed_limit:
+            print(f"           limit changes (t, limit): {result['history']}")
+
+
+if __name__ == "__main__":
+    main()
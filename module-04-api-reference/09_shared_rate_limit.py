@@ -0,0 +1,323 @@
+"""
+09_shared_rate_limit.py - One rate-limit budget shared by every process on a host
+"""
+
+import os
+import math
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "openai_rate_limit.sqlite3")
+
+
+class SharedRateLimiter:
+    """
+    Token-bucket limiter whose state lives in a local SQLite file.
+
+    Each worker process creating its own RateLimitManager would multiply the
+    org's RPM/TPM by the number of processes. Here every process opens the
+    same database and debits the same buckets inside a `BEGIN IMMEDIATE`
+    transaction, which SQLite serialises with a file lock - so the budget is
+    enforced host-wide without a separate server.
+
+    Fairness: each process's recent usage is tracked with exponential decay.
+    While the bucket is comfortably full anyone may draw from it; once it
+    drops below `reserve_fraction` of capacity, only processes using no more
+    than their fair share (total usage / active processes) are admitted, so a
+    greedy process cannot starve the others. Rows of processes that have not
+    been seen for `expire_after` seconds (exited or crashed) are deleted.
+    """
+
+    def __init__(self, rpm=500, tpm=200000, scope="default", db_path=DEFAULT_DB_PATH,
+                 fair_window=10.0, reserve_fraction=0.2, expire_after=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scope = scope
+        self.db_path = db_path
+        self.fair_window = fair_window
+        self.reserve_fraction = reserve_fraction
+        self.expire_after = expire_after or 10 * fair_window  # Decayed usage is ~0 by then
+        self._last_expiry = 0.0
+        self.client_id = f"{os.getpid()}-{threading.get_ident()}"
+        self._local = threading.local()
+        self._setup()
+
+    @property
+    def _db(self):
+        # sqlite3 connections must not be shared across threads
+        if not hasattr(self._local, "conn"):
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return self._local.conn
+
+    def _setup(self):
+        db = self._db
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY, level REAL, capacity REAL, rate REAL, updated REAL
+            )""")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS clients (
+                scope TEXT, client_id TEXT, usage REAL, updated REAL,
+                PRIMARY KEY (scope, client_id)
+            )""")
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        for name, capacity in ((f"{self.scope}:requests", self.rpm), (f"{self.scope}:tokens", self.tpm)):
+            db.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                (name, capacity, capacity, capacity / 60, now)
+            )
+            # Limits may have changed since the file was created
+            db.execute("UPDATE buckets SET capacity = ?, rate = ? WHERE name = ?", (capacity, capacity / 60, name))
+        db.execute("COMMIT")
+
+    def _decayed(self, usage, updated, now):
+        return usage * math.exp(-(now - updated) / self.fair_window)
+
+    def try_acquire(self, tokens=0):
+        """Take one request + `tokens` from the shared budget; returns seconds to wait (0 = granted)"""
+        db = self._db
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT name, level, capacity, rate, updated FROM buckets WHERE name IN (?, ?)",
+                (f"{self.scope}:requests", f"{self.scope}:tokens")
+            ).fetchall()
+            buckets = {}
+            for name, level, capacity, rate, updated in rows:
+                level = min(capacity, level + (now - updated) * rate)
+                buckets[name.rsplit(":", 1)[1]] = [level, capacity, rate]
+
+            needed = {"requests": 1, "tokens": min(tokens, buckets["tokens"][1])}
+            wait = max(
+                max(0.0, needed[kind] - level) / rate
+                for kind, (level, capacity, rate) in buckets.items()
+            )
+
+            if now - self._last_expiry > self.fair_window:
+                self._expire_clients(db, now)
+
+            if wait == 0 and self._scarce(buckets, needed):
+                wait = self._fair_share_wait(db, now)
+
+            if wait == 0:
+                for kind, bucket in buckets.items():
+                    bucket[0] -= needed[kind]
+                self._record_usage(db, needed["tokens"] + 1, now)
+            else:
+                # Register as active so others see a competitor for the fair share
+                self._record_usage(db, 0, now)
+
+            for kind, (level, _, _) in buckets.items():
+                db.execute(
+                    "UPDATE buckets SET level = ?, updated = ? WHERE name = ?",
+                    (level, now, f"{self.scope}:{kind}")
+                )
+            db.execute("COMMIT")
+            return wait
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _scarce(self, buckets, needed):
+        return any(
+            level - needed[kind] < capacity * self.reserve_fraction
+            for kind, (level, capacity, _) in buckets.items()
+        )
+
+    def _fair_share_wait(self, db, now):
+        """0 if this process is at or below its fair share, else a short back-off"""
+        active = db.execute(
+            "SELECT client_id, usage, updated FROM clients WHERE scope = ? AND updated > ?",
+            (self.scope, now - self.fair_window)
+        ).fetchall()
+        if len(active) <= 1:
+            return 0.0
+        usages = {client: self._decayed(usage, updated, now) for client, usage, updated in active}
+        fair_share = sum(usages.values()) / len(usages)
+        if usages.get(self.client_id, 0.0) <= fair_share:
+            return 0.0
+        return 0.01
+
+    def _expire_clients(self, db, now):
+        """Drop heartbeat rows of processes that stopped calling; runs at most once per fair_window"""
+        db.execute("DELETE FROM clients WHERE scope = ? AND updated < ?", (self.scope, now - self.expire_after))
+        self._last_expiry = now
+
+    def _record_usage(self, db, amount, now):
+        row = db.execute(
+            "SELECT usage, updated FROM clients WHERE scope = ? AND client_id = ?",
+            (self.scope, self.client_id)
+        ).fetchone()
+        usage = self._decayed(*row, now) if row else 0.0
+        db.execute(
+            "INSERT OR REPLACE INTO clients VALUES (?, ?, ?, ?)",
+            (self.scope, self.client_id, usage + amount, now)
+        )
+
+    def acquire(self, tokens=0, timeout=None):
+        """Block until the shared budget admits this request; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            # Jitter so waiting processes do not retry in lockstep
+            time.sleep(min(wait, 1.0) * random.uniform(0.8, 1.2))
+
+    def refund(self, tokens):
+        """Return unused tokens (estimate minus actual usage) to the shared bucket"""
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        db.execute(
+            "UPDATE buckets SET level = MIN(capacity, level + ?) WHERE name = ?",
+            (tokens, f"{self.scope}:tokens")
+        )
+        db.execute("COMMIT")
+
+    def stats(self):
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT client_id, usage, updated FROM clients WHERE scope = ? AND updated > ?",
+            (self.scope, now - self.fair_window)
+        ).fetchall()
+        return {client: round(self._decayed(usage, updated, now), 1) for client, usage, updated in rows}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def default_client():
+    """One OpenAI client per process, so its keep-alive connections are reused across calls"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI()
+    return _client
+
+
+def shared_chat_completion(limiter, prompt, model="gpt-5-mini", estimated_tokens=1000, client=None):
+    """
+    Chat completion admitted by the host-wide budget.
+
+    Pass `client` to use your own, e.g. ClientPool.get(...) from
+    05_multi_org_access.py; otherwise a per-process client is reused.
+    """
+    client = client or default_client()
+    limiter.acquire(tokens=estimated_tokens)
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    limiter.refund(estimated_tokens - response.usage.total_tokens)
+    return response.choices[0].message.content
+
+
+# --- Benchmarks (no API calls) ---
+
+def _latency_worker(db_path, iterations, results):
+    limiter = SharedRateLimiter(rpm=10**9, tpm=10**12, scope="bench", db_path=db_path)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        limiter.acquire(tokens=100)
+        samples.append((time.perf_counter() - start) * 1e6)
+    results.extend(samples)
+
+
+def benchmark_acquire_latency(processes=4, iterations=500):
+    """Acquire latency with N processes hammering the same database"""
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    SharedRateLimiter(rpm=10**9, tpm=10**12, scope="bench", db_path=db_path)
+
+    with multiprocessing.Manager() as manager:
+        results = manager.list()
+        workers = [
+            multiprocessing.Process(target=_latency_worker, args=(db_path, iterations, results))
+            for _ in range(processes)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        samples = sorted(results)
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    print(f"{processes} processes x {iterations} acquires: "
+          f"p50 {pct(0.50):.0f}µs, p99 {pct(0.99):.0f}µs, "
+          f"{len(samples) / elapsed:,.0f} acquires/s overall")
+
+
+def _fairness_worker(db_path, name, duration, greedy, results):
+    limiter = SharedRateLimiter(rpm=600, tpm=10**9, scope="fair", db_path=db_path)
+    granted = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        if limiter.acquire(timeout=max(0, end - time.monotonic())):
+            granted += 1
+            if not greedy:
+                time.sleep(0.05)  # A polite worker that does some work between requests
+    results[name] = granted
+
+
+def demonstrate_fairness(duration=5):
+    """Three greedy processes and one polite one share a drained 600 RPM budget"""
+    db_path = os.path.join(tempfile.mkdtemp(), "fair.sqlite3")
+    SharedRateLimiter(rpm=600, tpm=10**9, scope="fair", db_path=db_path)
+
+    # Start from an empty bucket to show steady-state sharing, not who wins the initial burst
+    with sqlite3.connect(db_path) as db:
+        db.execute("UPDATE buckets SET level = 0, updated = ? WHERE name = 'fair:requests'", (time.time(),))
+
+    with multiprocessing.Manager() as manager:
+        results = manager.dict()
+        workers = [
+            multiprocessing.Process(
+                target=_fairness_worker,
+                args=(db_path, f"worker-{i}{' (greedy)' if i < 3 else ' (polite)'}", duration, i < 3, results)
+            )
+            for i in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        total = sum(results.values())
+        print(f"Granted {total} requests in {duration}s (refill allows ~{600 * duration // 60}):")
+        for name, granted in sorted(results.items()):
+            print(f"  {name:<20} {granted}")
+
+
+def main():
+    print("🔗 SHARED RATE-LIMIT BUDGET (SQLite)")
+    print("="*60)
+    benchmark_acquire_latency(processes=1)
+    benchmark_acquire_latency(processes=4)
+    benchmark_acquire_latency(processes=8)
+    print()
+    demonstrate_fairness()
+
+
+if __name__ == "__main__":
+    main()
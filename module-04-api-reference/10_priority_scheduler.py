@@ -0,0 +1,282 @@
+"""
+10_priority_scheduler.py - Keep interactive traffic fast while batch jobs share the limits
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+client = OpenAI()
+
+
+class DeadlineExceeded(Exception):
+    """Raised on a request's future when it expired before being sent"""
+
+
+class TokenBucket:
+    """Token bucket from RateLimitManager, reduced to the refill/take logic"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.refill_rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def wait_time(self, amount, keep=0.0):
+        """Seconds until `amount` can be taken while leaving `keep` behind"""
+        missing = min(amount + keep, self.capacity) - self.level
+        return max(0.0, missing / self.refill_rate)
+
+
+class _Lane:
+    """One priority lane with weighted fair queuing across tenants"""
+
+    def __init__(self, name):
+        self.name = name
+        self.heap = []                # (finish tag, sequence, request)
+        self.virtual_time = 0.0
+        self.tenant_finish = {}
+
+    def push(self, request, weight, sequence):
+        # WFQ: a tenant's next request finishes `cost / weight` after its previous one,
+        # so a tenant with weight 2 gets twice the throughput of weight 1 under contention
+        start = max(self.virtual_time, self.tenant_finish.get(request["tenant"], 0.0))
+        finish = start + request["tokens"] / weight
+        self.tenant_finish[request["tenant"]] = finish
+        heapq.heappush(self.heap, (finish, sequence, request))
+
+    def peek(self):
+        return self.heap[0][2] if self.heap else None
+
+    def pop(self):
+        finish, _, request = heapq.heappop(self.heap)
+        self.virtual_time = max(self.virtual_time, finish - request["tokens"] / request["weight"])
+        return request
+
+
+class PriorityScheduler:
+    """
+    Request scheduler in front of the client with priority lanes.
+
+    - Lanes are served in strict priority order: interactive first, then
+      background.
+    - Background work may not dip into the last `background_reserve` of the
+      request and token budgets. That headroom is kept so a newly arrived interactive
+      request can go out immediately instead of queueing behind batch work.
+    - Within a lane, tenants share capacity by weighted fair queuing.
+    - Requests carry an optional deadline. If a request is stale by the time
+      it reaches the front, it is dropped with DeadlineExceeded instead of
+      wasting budget on an answer nobody is waiting for.
+    """
+
+    LANES = ("interactive", "background")
+
+    def __init__(self, rpm=500, tpm=200000, max_concurrency=16,
+                 tenant_weights=None, background_reserve=0.2):
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.tenant_weights = tenant_weights or {}
+        self.background_reserve = background_reserve
+
+        self.lanes = {name: _Lane(name) for name in self.LANES}
+        self.stats = {
+            name: {"completed": 0, "dropped": 0, "queue_waits": deque(maxlen=10000)}
+            for name in self.LANES
+        }
+
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, func, *args, lane="interactive", tenant="default", tokens=1000,
+               deadline=None, **kwargs):
+        """Queue func(*args, **kwargs); deadline is seconds from now. Returns a Future."""
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+
+        request = {
+            "func": func,
+            "args": args,
+            "kwargs": kwargs,
+            "tenant": tenant,
+            "weight": self.tenant_weights.get(tenant, 1.0),
+            "tokens": tokens,
+            "enqueued": time.monotonic(),
+            "deadline": time.monotonic() + deadline if deadline else None,
+            "future": Future(),
+        }
+        with self._cond:
+            self.lanes[lane].push(request, request["weight"], next(self._sequence))
+            self._cond.notify()
+        return request["future"]
+
+    def _drop_expired(self, lane):
+        now = time.monotonic()
+        while lane.heap:
+            request = lane.peek()
+            if request["deadline"] is None or request["deadline"] > now:
+                return
+            lane.pop()
+            self.stats[lane.name]["dropped"] += 1
+            request["future"].set_exception(DeadlineExceeded(
+                f"{lane.name} request from {request['tenant']} expired after "
+                f"{now - request['enqueued']:.2f}s in queue"
+            ))
+
+    def _next_request(self):
+        """Pick the next request to send, or return seconds to wait"""
+        self.requests_bucket.refill()
+        self.tokens_bucket.refill()
+        shortest_wait = None
+
+        for name in self.LANES:
+            lane = self.lanes[name]
+            self._drop_expired(lane)
+            request = lane.peek()
+            if request is None:
+                continue
+
+            # Background must leave the reserve untouched for interactive arrivals
+            reserve = self.background_reserve if name == "background" else 0.0
+            wait = max(
+                self.requests_bucket.wait_time(1, keep=self.requests_bucket.capacity * reserve),
+                self.tokens_bucket.wait_time(request["tokens"], keep=self.tokens_bucket.capacity * reserve),
+            )
+            if wait == 0:
+                lane.pop()
+                self.requests_bucket.level -= 1
+                self.tokens_bucket.level -= min(request["tokens"], self.tokens_bucket.capacity)
+                return name, request
+            shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+
+            if name == "interactive":
+                break  # Never let background jump an interactive request that is waiting on budget
+
+        return None, shortest_wait
+
+    def _dispatch_loop(self):
+        while self._running:
+            self._slots.acquire()  # Only pick a request once a worker is free
+            with self._cond:
+                while self._running:
+                    lane_name, result = self._next_request()
+                    if lane_name:
+                        break
+                    self._cond.wait(timeout=result)  # None = wait for a submit
+                else:
+                    self._slots.release()
+                    return
+            self._pool.submit(self._run, lane_name, result)
+
+    def _run(self, lane_name, request):
+        started = time.monotonic()
+        try:
+            result = request["func"](*request["args"], **request["kwargs"])
+            request["future"].set_result(result)
+        except Exception as e:
+            request["future"].set_exception(e)
+        finally:
+            with self._cond:
+                stats = self.stats[lane_name]
+                stats["completed"] += 1
+                stats["queue_waits"].append(started - request["enqueued"])
+            self._slots.release()
+
+    def latency_report(self):
+        """Queue-wait percentiles per lane"""
+        report = {}
+        with self._cond:
+            for name, stats in self.stats.items():
+                waits = sorted(stats["queue_waits"])
+                pct = lambda p: round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 1) if waits else None
+                report[name] = {
+                    "completed": stats["completed"],
+                    "dropped": stats["dropped"],
+                    "p50_wait_ms": pct(0.50),
+                    "p99_wait_ms": pct(0.99),
+                }
+        return report
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._slots.release()
+        self._pool.shutdown(wait=True)
+
+
+scheduler = PriorityScheduler()
+
+
+def scheduled_completion(prompt, lane="interactive", tenant="default", deadline=None, model="gpt-5-mini"):
+    """Submit a chat completion through the shared scheduler and wait for it"""
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.choices[0].message.content
+
+    tokens = len(prompt) // 4 + 500  # Rough prompt + completion budget
+    return scheduler.submit(call, lane=lane, tenant=tenant, tokens=tokens, deadline=deadline).result()
+
+
+def simulate(background_jobs=300, interactive_requests=40, use_lanes=True):
+    """Offline: a batch flood from two tenants plus a steady trickle of chat traffic"""
+    sched = PriorityScheduler(rpm=1200, tpm=10**9, max_concurrency=8,
+                              tenant_weights={"evals": 2.0, "catalog": 1.0})
+    fake_call = lambda: time.sleep(0.05)
+    futures = []
+
+    for i in range(background_jobs):
+        if use_lanes:
+            lane, tenant = "background", ("evals" if i % 2 else "catalog")
+        else:
+            lane, tenant = "interactive", "shared"  # Everything in one first-come queue
+        futures.append(sched.submit(fake_call, lane=lane, tenant=tenant, tokens=1, deadline=10))
+
+    for _ in range(interactive_requests):
+        tenant = "chat" if use_lanes else "shared"
+        futures.append(sched.submit(fake_call, lane="interactive", tenant=tenant, tokens=1, deadline=2))
+        time.sleep(0.1)
+
+    for future in futures:
+        try:
+            future.result()
+        except DeadlineExceeded:
+            pass
+
+    sched.shutdown()
+    return sched.latency_report()
+
+
+def main():
+    print("🚦 PRIORITY SCHEDULER - offline simulation (1200 RPM budget)")
+    print("="*60)
+
+    for use_lanes in (False, True):
+        report = simulate(use_lanes=use_lanes)
+        label = "With lanes" if use_lanes else "Single FIFO lane"
+        print(f"\n{label}:")
+        for lane, stats in report.items():
+            if stats["completed"] or stats["dropped"]:
+                print(f"  {lane:<12} {stats}")
+
+
+if __name__ == "__main__":
+    main()
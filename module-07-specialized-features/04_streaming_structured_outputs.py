@@ -0,0 +1,321 @@
+"""
+04_streaming_structured_outputs.py - Stream JSON schema responses field by field
+"""
+
+import re
+import json
+import time
+from openai import OpenAI
+
+client = OpenAI()
+
+# Mirrors ProductAnalysis from projects/02-vision-assistant
+PRODUCT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "features": {"type": "array", "items": {"type": "string"}},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "estimated_category": {"type": "string"},
+        "visual_condition": {"type": "string"}
+    },
+    "required": ["title", "description", "features", "tags", "estimated_category", "visual_condition"],
+    "additionalProperties": False
+}
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}]')
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """
+    Push parser for JSON that arrives in chunks.
+
+    Each character is examined once, so feeding a whole response costs
+    O(total length) no matter how many chunks it arrives in. Containers are
+    attached to their parent as soon as they open, which means `partial`
+    always holds everything parsed so far.
+
+    feed() returns a list of (event, path, value) tuples:
+    - ("field", ("title",), "Red Sneaker")   an object member finished
+    - ("item", ("features", 0), "Mesh")      an array element finished
+    - ("complete", (), {...})                the whole document finished
+    """
+
+    def __init__(self):
+        self.partial = None
+        self.done = False
+
+        # Frames are [container, state, key]; state is what we expect next
+        self._stack = []
+        self._token = []           # Raw characters of the current string/scalar
+        self._mode = None          # None, "string", "key" or "scalar"
+        self._escaped = False
+
+    @property
+    def path(self):
+        """Path to the value currently being parsed"""
+        path = []
+        for container, _, key in self._stack:
+            path.append(key if isinstance(container, dict) else len(container))
+        return tuple(path)
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the events it completed"""
+        events = []
+        i = 0
+        n = len(chunk)
+
+        while i < n:
+            if self._mode in ("string", "key"):
+                i = self._consume_string(chunk, i, events)
+                continue
+
+            if self._mode == "scalar":
+                match = _SCALAR_END.search(chunk, i)
+                end = match.start() if match else n
+                self._token.append(chunk[i:end])
+                i = end
+                if match:
+                    self._finish_scalar(events)
+                continue
+
+            char = chunk[i]
+            i += 1
+
+            if char in _WHITESPACE:
+                continue
+
+            if self.done:
+                raise ValueError(f"Unexpected data after end of JSON: {char!r}")
+
+            state = self._stack[-1][1] if self._stack else "value"
+
+            if state == "key":
+                if char == '"':
+                    self._mode = "key"
+                elif char == "}" and not self._stack[-1][0]:
+                    self._close(events)
+                else:
+                    raise ValueError(f"Expected object key, got {char!r}")
+            elif state == "colon":
+                if char != ":":
+                    raise ValueError(f"Expected ':', got {char!r}")
+                self._stack[-1][1] = "value"
+            elif state == "comma_or_end":
+                frame = self._stack[-1]
+                if char == ",":
+                    frame[1] = "key" if isinstance(frame[0], dict) else "value"
+                elif char == ("}" if isinstance(frame[0], dict) else "]"):
+                    self._close(events)
+                else:
+                    raise ValueError(f"Expected ',' or closing bracket, got {char!r}")
+            else:  # state == "value"
+                if char == "{":
+                    self._open({}, "key")
+                elif char == "[":
+                    self._open([], "value")
+                elif char == "]" and self._stack and isinstance(self._stack[-1][0], list) \
+                        and not self._stack[-1][0]:
+                    self._close(events)
+                elif char == '"':
+                    self._mode = "string"
+                elif char in ",:]}":
+                    raise ValueError(f"Expected a value, got {char!r}")
+                else:
+                    self._mode = "scalar"
+                    self._token.append(char)
+
+        return events
+
+    def _consume_string(self, chunk, i, events):
+        """Scan string content in bulk up to the next quote or backslash"""
+        n = len(chunk)
+        while i < n:
+            if self._escaped:
+                self._token.append(chunk[i])
+                self._escaped = False
+                i += 1
+                continue
+
+            match = _STRING_SPECIAL.search(chunk, i)
+            if not match:
+                self._token.append(chunk[i:])
+                return n
+
+            self._token.append(chunk[i:match.start()])
+            i = match.end()
+            if match.group() == "\\":
+                self._token.append("\\")
+                self._escaped = True
+                continue
+
+            # Closing quote: decode escapes once, at the end of the string
+            text = json.loads('"' + "".join(self._token) + '"')
+            self._token = []
+            if self._mode == "key":
+                self._mode = None
+                self._stack[-1][2] = text
+                self._stack[-1][1] = "colon"
+            else:
+                self._mode = None
+                self._finish_value(text, events)
+            return i
+        return i
+
+    def _finish_scalar(self, events):
+        raw = "".join(self._token)
+        self._token = []
+        self._mode = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON literal: {raw!r}") from None
+        self._finish_value(value, events)
+
+    def _attach(self, value):
+        """Place a value into its parent container (or make it the root)"""
+        if not self._stack:
+            self.partial = value
+            return
+        container, _, key = self._stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+
+    def _open(self, container, state):
+        self._attach(container)
+        self._stack.append([container, state, None])
+
+    def _close(self, events):
+        container, _, _ = self._stack.pop()
+        self._emit(container, events)
+
+    def _finish_value(self, value, events):
+        self._attach(value)
+        self._emit(value, events)
+
+    def _emit(self, value, events):
+        """Record a completed value and advance the parent's state"""
+        if not self._stack:
+            self.done = True
+            events.append(("complete", (), value))
+            return
+
+        frame = self._stack[-1]
+        container, _, key = frame
+        if isinstance(container, dict):
+            events.append(("field", self.path, value))
+        else:
+            events.append(("item", self.path[:-1] + (len(container) - 1,), value))
+        frame[1] = "comma_or_end"
+
+    def close(self):
+        """Signal end of input; flushes a trailing top-level scalar"""
+        events = []
+        if self._mode == "scalar":
+            self._finish_scalar(events)
+        if not self.done:
+            raise ValueError("Stream ended before JSON document was complete")
+        return events
+
+
+def stream_structured_output(messages, schema, name="structured_output", model="gpt-5-mini"):
+    """
+    Stream a json_schema response, yielding (events, partial) after each chunk.
+
+    `partial` is the live object built so far, so a UI can render the title
+    and the first features long before the last tag arrives.
+    """
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": name, "schema": schema, "strict": True}
+        },
+        stream=True
+    )
+
+    parser = IncrementalJSONParser()
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content
+        if content:
+            events = parser.feed(content)
+            if events:
+                yield events, parser.partial
+
+    final_events = parser.close()
+    if final_events:
+        yield final_events, parser.partial
+
+
+def stream_product_listing(product_description):
+    print(f"\nProduct: {product_description}\n")
+    start = time.time()
+
+    messages = [
+        {"role": "system", "content": "You are an expert e-commerce copywriter. Generate listing details."},
+        {"role": "user", "content": product_description}
+    ]
+
+    for events, partial in stream_structured_output(messages, PRODUCT_SCHEMA, name="product_analysis"):
+        for event, path, value in events:
+            elapsed = time.time() - start
+            if event == "field" and len(path) == 1 and not isinstance(value, (dict, list)):
+                print(f"[{elapsed:5.2f}s] {path[0]}: {value}")
+            elif event == "item":
+                print(f"[{elapsed:5.2f}s] {path[0]}[{path[1]}]: {value}")
+            elif event == "complete":
+                print(f"[{elapsed:5.2f}s] ✅ Complete ({len(partial)} fields)")
+
+
+def benchmark_parsing(n_chunks=2000):
+    """Compare incremental parsing against re-parsing the growing buffer"""
+    document = json.dumps({
+        "title": "Trail Running Shoe",
+        "description": "Lightweight breathable mesh upper. " * 20,
+        "features": [f"Feature {i}" for i in range(200)],
+        "tags": [f"tag{i}" for i in range(200)],
+        "estimated_category": "Fashion",
+        "visual_condition": "New"
+    })
+    size = max(1, len(document) // n_chunks)
+    chunks = [document[i:i + size] for i in range(0, len(document), size)]
+
+    start = time.perf_counter()
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        try:
+            json.loads(buffer)
+        except json.JSONDecodeError:
+            pass
+    reparse_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    parser = IncrementalJSONParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    incremental_ms = (time.perf_counter() - start) * 1000
+
+    print(f"\n{len(document):,} bytes in {len(chunks)} chunks")
+    print(f"Re-parse buffer each chunk: {reparse_ms:8.2f} ms (O(n²), and no partial results)")
+    print(f"Incremental parser:         {incremental_ms:8.2f} ms (O(n))")
+
+
+def main():
+    print("🧩 STREAMING STRUCTURED OUTPUTS")
+    print("="*60)
+
+    benchmark_parsing()
+    stream_product_listing("Red canvas high-top sneakers, lightly worn, white rubber sole.")
+
+if __name__ == "__main__":
+    main()
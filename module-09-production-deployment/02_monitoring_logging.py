@@ -3,21 +3,286 @@
 """
 
 import time
+import queue
+import atexit
 import logging
 import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from openai import OpenAI
 
-# Configure structured logging
-logging.basicConfig(level=logging.INFO, format='%(message)s')
+client = OpenAI()
+
+
+class JsonFormatter(logging.Formatter):
+    """Serialise dict messages to JSON - runs on the listener thread, not the request path"""
+
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            return json.dumps(record.msg)
+        return super().format(record)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hand records to a bounded queue without formatting them.
+
+    The stock QueueHandler formats every record on the calling thread;
+    here the record goes on the queue as-is. enqueue() also takes a plain
+    event dict, so log_interaction pays for one put and nothing else - no
+    LogRecord, no JSON. When the queue is full, records are dropped and
+    counted (block=True applies backpressure instead).
+    """
+
+    def __init__(self, log_queue, block=False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class EventQueueListener(QueueListener):
+    """
+    QueueListener that turns plain event dicts into LogRecords on its own thread.
+
+    stop() drains the queue, then flushes and closes the handlers; it is
+    safe to call twice.
+    """
+
+    def __init__(self, log_queue, *handlers, name="ai_monitor"):
+        super().__init__(log_queue, *handlers)
+        self.name = name
+
+    def prepare(self, record):
+        if isinstance(record, dict):
+            return logging.makeLogRecord({
+                "name": self.name, "levelno": logging.INFO, "levelname": "INFO", "msg": record
+            })
+        return record
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()  # Drains the queue first
+        for handler in self.handlers:
+            handler.close()
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that writes batches instead of flushing every record"""
+
+    def __init__(self, filename, batch_size=256, flush_interval=1.0, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self.batch_size = batch_size
+        self.buffer = []
+        self._stop = threading.Event()
+        # Flush partial batches when traffic is quiet
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+        self._flusher.start()
+
+    def emit(self, record):
+        # Called with the handler lock held
+        self.buffer.append(self.format(record) + self.terminator)
+        if len(self.buffer) >= self.batch_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if not self.buffer:
+            return
+        data = "".join(self.buffer)
+        self.buffer = []
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes and self.stream.tell() + len(data) >= self.maxBytes:
+            self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+        self.stream.write(data)
+        self.stream.flush()
+
+    def _flush_periodically(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self._write_buffer()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        super().close()
+
+
+def setup_logging(log_file="ai_monitor.log", max_queue=10000, block=False,
+                  max_bytes=50 * 1024 * 1024, backup_count=5, name="ai_monitor"):
+    """
+    Route the ai_monitor logger through a queue to a background batch writer.
+
+    Starts the listener and flusher threads; call it once at startup, not at
+    import. Without it, the first log_interaction() installs the defaults.
+    """
+    global _event_handler
+    log_queue = queue.Queue(maxsize=max_queue)
+    queue_handler = DroppingQueueHandler(log_queue, block=block)
+
+    file_handler = BatchingRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(JsonFormatter("%(message)s"))
+
+    listener = EventQueueListener(log_queue, file_handler, console_handler, name=name)
+    listener.start()
+    atexit.register(listener.stop)  # Drains the queue, then writes the last batch
+
+    log = logging.getLogger(name)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    log.addHandler(queue_handler)
+    if name == logger.name:
+        _event_handler = queue_handler
+    return log, queue_handler, listener
+
+
 logger = logging.getLogger("ai_monitor")
+_event_handler = None          # Queue handler log_interaction() writes to
+_event_handler_lock = threading.Lock()
 
-client = OpenAI()
 
-def log_interaction(event_type, duration_ms, tokens_in, tokens_out, model, status="success"):
+def event_handler():
+    """The ai_monitor queue handler, installing the default setup_logging() on first use"""
+    if _event_handler is None:
+        with _event_handler_lock:
+            if _event_handler is None:
+                setup_logging()
+    return _event_handler
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+
+class Metrics:
+    """
+    Minimal Prometheus-style registry: labelled counters and histograms.
+    render() produces the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # name -> (type, help)
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._buckets = {}     # name -> bucket upper bounds
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text)
+
+    def histogram(self, name, help_text, buckets):
+        self._meta[name] = ("histogram", help_text)
+        self._buckets[name] = buckets
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets[name]
+        with self._lock:
+            series = self._histograms.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (series, labels), value in self._counters.items():
+                        if series == name:
+                            lines.append(f"{name}{self._labels(labels)} {value}")
+                    continue
+                for (series, labels), values in self._histograms.items():
+                    if series != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self._buckets[name], values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {values[-1]}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {values[-2]}")
+                    lines.append(f"{name}_count{self._labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.counter("openai_requests_total", "Chat completion requests by model, status and mode")
+metrics.counter("openai_errors_total", "Failed requests by model and error class")
+metrics.counter("openai_tokens_total", "Tokens used by model and type (prompt/completion)")
+metrics.counter("openai_cost_usd_total", "Estimated spend in USD by model")
+metrics.histogram("openai_request_duration_seconds", "End-to-end request latency", LATENCY_BUCKETS)
+metrics.histogram("openai_time_to_first_token_seconds", "Time to first streamed token", TTFT_BUCKETS)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the application log
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    """Serve /metrics for Prometheus from a background thread"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def log_interaction(event_type, duration_ms, tokens_in, tokens_out, model, status="success",
+                    ttft_ms=None, error_class=None, stream=False):
     """
     Structured log entry for observability tools (Datadog, Splunk, etc.)
+    Also updates the Prometheus metrics served on /metrics.
     """
     event = {
+        "timestamp": time.time(),
         "event": event_type,
         "status": status,
         "duration_ms": round(duration_ms, 2),
@@ -29,7 +294,26 @@ def log_interaction(event_type, duration_ms, tokens_in, tokens_out, model, statu
         },
         "cost_estimate": estimate_cost(model, tokens_in, tokens_out)
     }
-    logger.info(json.dumps(event))
+    if ttft_ms is not None:
+        event["ttft_ms"] = round(ttft_ms, 2)
+    if error_class:
+        event["error_class"] = error_class
+    # Fast path: the dict itself goes on the queue; the LogRecord and the
+    # JSON are built on the listener thread, so the request pays for one put
+    handler = event_handler()  # Before the level check: the default setup sets the level
+    if logger.isEnabledFor(logging.INFO):
+        handler.enqueue(event)
+
+    mode = "stream" if stream else "sync"
+    metrics.inc("openai_requests_total", model=model, status="error" if error_class else "success", mode=mode)
+    metrics.observe("openai_request_duration_seconds", duration_ms / 1000, model=model, mode=mode)
+    if error_class:
+        metrics.inc("openai_errors_total", model=model, error_class=error_class)
+    if ttft_ms is not None:
+        metrics.observe("openai_time_to_first_token_seconds", ttft_ms / 1000, model=model)
+    metrics.inc("openai_tokens_total", tokens_in, model=model, type="prompt")
+    metrics.inc("openai_tokens_total", tokens_out, model=model, type="completion")
+    metrics.inc("openai_cost_usd_total", event["cost_estimate"], model=model)
 
 def estimate_cost(model, prompt_tok, comp_tok):
     # Hypothetical 2026 pricing
@@ -63,13 +347,98 @@ def safe_chat_completion(prompt):
         
     except Exception as e:
         duration = (time.time() - start) * 1000
-        log_interaction("chat_completion", duration, 0, 0, model, status=f"error: {str(e)}")
+        log_interaction("chat_completion", duration, 0, 0, model, status=f"error: {str(e)}",
+                        error_class=type(e).__name__)
         return "Sorry, I encountered an error."
 
+def safe_chat_completion_stream(prompt):
+    """Streaming variant: also measures time to first token"""
+    start = time.time()
+    model = "gpt-5-mini"
+    ttft = None
+    parts = []
+    usage = None
+
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if ttft is None:
+                    ttft = (time.time() - start) * 1000
+                parts.append(chunk.choices[0].delta.content)
+                print(chunk.choices[0].delta.content, end="", flush=True)
+            if chunk.usage:
+                usage = chunk.usage
+        print()
+
+        duration = (time.time() - start) * 1000
+        log_interaction(
+            "chat_completion_stream",
+            duration,
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+            model,
+            ttft_ms=ttft,
+            stream=True
+        )
+        return "".join(parts)
+
+    except Exception as e:
+        duration = (time.time() - start) * 1000
+        log_interaction("chat_completion_stream", duration, 0, 0, model, status=f"error: {str(e)}",
+                        ttft_ms=ttft, error_class=type(e).__name__, stream=True)
+        return "Sorry, I encountered an error."
+
+def benchmark_logging_overhead(records=20000):
+    """Request-path cost of one log call, synchronous vs queued"""
+    event = {"event": "chat_completion", "status": "success", "duration_ms": 420.0, "model": "gpt-5-mini",
+             "token_usage": {"prompt": 10, "completion": 20, "total": 30}, "cost_estimate": 1.35e-05}
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        sync_logger = logging.getLogger("ai_monitor.bench.sync")
+        sync_logger.setLevel(logging.INFO)
+        sync_logger.propagate = False
+        sync_handler = logging.FileHandler(f"{log_dir}/sync.log", delay=True)
+        sync_logger.addHandler(sync_handler)
+        start = time.perf_counter()
+        for _ in range(records):
+            sync_logger.info(json.dumps(event))
+        sync_us = (time.perf_counter() - start) / records * 1e6
+        sync_logger.removeHandler(sync_handler)
+        sync_handler.close()
+
+        bench_logger, bench_queue_handler, bench_listener = setup_logging(
+            f"{log_dir}/queued.log", max_queue=records, name="ai_monitor.bench")
+        bench_listener.handlers = bench_listener.handlers[:1]  # File only, no console spam
+        start = time.perf_counter()
+        for _ in range(records):
+            bench_queue_handler.enqueue(dict(event))
+        queued_us = (time.perf_counter() - start) / records * 1e6
+        bench_listener.stop()  # Also closes the file before the directory is removed
+        atexit.unregister(bench_listener.stop)
+        bench_logger.removeHandler(bench_queue_handler)
+
+    print(f"Synchronous json.dumps + FileHandler:   {sync_us:.2f} µs per log call")
+    print(f"Queued dict (serialised in background): {queued_us:.2f} µs per log call, "
+          f"{bench_queue_handler.dropped} dropped")
+
 def main():
+    setup_logging()
     print("📊 MONITORING DEMO (Check logs)")
+    server = start_metrics_server()
+    print(f"Metrics: http://127.0.0.1:{server.server_port}/metrics")
+
     response = safe_chat_completion("Hello, how are you?")
     print(f"Response: {response}")
+    safe_chat_completion_stream("Give me one tip for monitoring an AI app.")
+
+    print("\n" + metrics.render())
+    benchmark_logging_overhead()
 
 if __name__ == "__main__":
     main()
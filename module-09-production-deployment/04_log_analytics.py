@@ -0,0 +1,309 @@
+"""
+04_log_analytics.py - Latency, token, cost and error reports from JSONL request logs
+
+Reads the JSON lines written by RequestLogger (module 4) and log_interaction
+(02_monitoring_logging.py):
+
+    python 04_log_analytics.py api_requests.log ai_monitor.log --workers 8
+    python 04_log_analytics.py --demo 2000000      # generate a synthetic log and analyse it
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import argparse
+import tempfile
+import contextlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Same hypothetical pricing as 02_monitoring_logging.py (USD per token)
+RATES = {
+    "gpt-5-mini": {"in": 0.15 / 1000000, "out": 0.60 / 1000000},
+    "gpt-4o":    {"in": 2.50 / 1000000, "out": 10.00 / 1000000}
+}
+
+# Log-spaced histogram buckets, 1 ms to 10 min: ~2.7% wide, so percentiles are within ~1.4%
+LATENCY_EDGES = np.geomspace(1, 600000, 501)
+NUM_BUCKETS = len(LATENCY_EDGES) + 1
+
+
+def find_shards(path, workers):
+    """Split a file into byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = [0]
+        for i in range(1, workers):
+            newline = mm.find(b"\n", size * i // workers)
+            if newline == -1:
+                break
+            if newline + 1 > bounds[-1]:
+                bounds.append(newline + 1)
+        bounds.append(size)
+    return [(path, start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _field(record, *names, default=None):
+    for name in names:
+        if name in record:
+            return record[name]
+    return default
+
+
+def parse_shard(shard):
+    """
+    Parse one byte range and aggregate it per (model, hour).
+
+    Runs in a worker process. Lines are parsed into flat columns, then
+    grouped and histogrammed with NumPy, so only small per-group arrays
+    travel back to the parent, not millions of parsed rows.
+    """
+    path, start, end = shard
+    timestamps, models, latencies, ttfts = [], [], [], []
+    prompt_tokens, completion_tokens, costs, errors = [], [], [], []
+    error_classes = Counter()
+    bad_lines = 0
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            # Copy one line at a time rather than the whole shard
+            newline = mm.find(b"\n", pos, end)
+            if newline == -1:
+                newline = end
+            line = mm[pos:newline]
+            pos = newline + 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                bad_lines += 1
+                continue
+
+            model = record.get("model") or "unknown"
+            usage = record.get("token_usage") or {}
+            prompt = usage.get("prompt", 0)
+            completion = usage.get("completion", 0)
+            total = usage.get("total", record.get("tokens", prompt + completion))
+            if not usage:
+                completion = total  # RequestLogger only records the total
+
+            status = str(record.get("status", "success"))
+            failed = status != "success"
+            if failed:
+                error_class = _field(record, "error_type", "error_class", default=status.split(":")[0])
+                error_classes[(model, error_class)] += 1
+
+            cost = record.get("cost_estimate")
+            if cost is None:
+                rate = RATES.get(model, RATES["gpt-5-mini"])
+                cost = prompt * rate["in"] + completion * rate["out"]
+
+            timestamps.append(record.get("timestamp", 0.0))
+            models.append(model)
+            latencies.append(_field(record, "duration_ms", default=np.nan))
+            ttfts.append(_field(record, "ttft_ms", default=np.nan))
+            prompt_tokens.append(prompt)
+            completion_tokens.append(completion)
+            costs.append(cost)
+            errors.append(failed)
+
+    if not models:
+        return {"groups": [], "error_classes": error_classes, "lines": 0, "bad_lines": bad_lines}
+
+    # Group by (model, hour) with NumPy
+    model_names, model_ids = np.unique(np.array(models), return_inverse=True)
+    hours = (np.asarray(timestamps, dtype=np.float64) // 3600).astype(np.int64)
+    keys = np.stack([model_ids, hours], axis=1)
+    group_keys, group_ids = np.unique(keys, axis=0, return_inverse=True)
+    group_ids = group_ids.ravel()
+    groups = len(group_keys)
+
+    def group_sum(values):
+        return np.bincount(group_ids, weights=np.asarray(values, dtype=np.float64), minlength=groups)
+
+    def group_histogram(values):
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        buckets = np.searchsorted(LATENCY_EDGES, values[present])
+        flat = group_ids[present] * NUM_BUCKETS + buckets
+        return np.bincount(flat, minlength=groups * NUM_BUCKETS).reshape(groups, NUM_BUCKETS)
+
+    return {
+        "groups": [(str(model_names[m]), int(h)) for m, h in group_keys],
+        "requests": np.bincount(group_ids, minlength=groups),
+        "errors": group_sum(errors),
+        "prompt_tokens": group_sum(prompt_tokens),
+        "completion_tokens": group_sum(completion_tokens),
+        "cost": group_sum(costs),
+        "latency": group_histogram(latencies),
+        "ttft": group_histogram(ttfts),
+        "error_classes": error_classes,
+        "lines": len(models),
+        "bad_lines": bad_lines,
+    }
+
+
+def merge(results):
+    """Combine per-shard aggregates into one table keyed by (model, hour)"""
+    table = {}
+    error_classes = Counter()
+    lines = bad_lines = 0
+    for result in results:
+        error_classes.update(result["error_classes"])
+        lines += result["lines"]
+        bad_lines += result["bad_lines"]
+        for i, key in enumerate(result["groups"]):
+            row = table.setdefault(key, {
+                "requests": 0, "errors": 0.0, "prompt_tokens": 0.0, "completion_tokens": 0.0, "cost": 0.0,
+                "latency": np.zeros(NUM_BUCKETS, dtype=np.int64), "ttft": np.zeros(NUM_BUCKETS, dtype=np.int64),
+            })
+            for name in ("requests", "errors", "prompt_tokens", "completion_tokens", "cost", "latency", "ttft"):
+                row[name] = row[name] + result[name][i]
+    return table, error_classes, lines, bad_lines
+
+
+def percentiles(histogram, qs=(0.50, 0.95, 0.99)):
+    """Approximate percentiles from a bucket histogram (geometric bucket midpoints)"""
+    count = histogram.sum()
+    if not count:
+        return [None] * len(qs)
+    cumulative = np.cumsum(histogram)
+    edges = np.concatenate([[LATENCY_EDGES[0]], LATENCY_EDGES, [LATENCY_EDGES[-1]]])
+    results = []
+    for q in qs:
+        bucket = int(np.searchsorted(cumulative, q * count))
+        results.append(float(np.sqrt(edges[bucket] * edges[bucket + 1])))
+    return results
+
+
+def summarise(rows):
+    requests = sum(row["requests"] for row in rows)
+    errors = sum(row["errors"] for row in rows)
+    latency = sum(row["latency"] for row in rows)
+    ttft = sum(row["ttft"] for row in rows)
+    return {
+        "requests": int(requests),
+        "error_rate": errors / requests if requests else 0.0,
+        "latency": percentiles(latency),
+        "ttft_p95": percentiles(ttft, (0.95,))[0],
+        "tokens": int(sum(row["prompt_tokens"] + row["completion_tokens"] for row in rows)),
+        "cost": float(sum(row["cost"] for row in rows)),
+    }
+
+
+def print_report(table, error_classes, max_hours=24):
+    fmt = lambda ms: f"{ms:8.0f}" if ms is not None else "       -"
+    header = f"{'requests':>10} {'err %':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttft p95':>8} {'tokens':>12} {'cost $':>10}"
+
+    def line(label, stats, width):
+        p50, p95, p99 = stats["latency"]
+        return (f"{label:<{width}} {stats['requests']:>10,} {stats['error_rate'] * 100:>6.2f} "
+                f"{fmt(p50)} {fmt(p95)} {fmt(p99)} {fmt(stats['ttft_p95'])} "
+                f"{stats['tokens']:>12,} {stats['cost']:>10.4f}")
+
+    models = sorted({model for model, _ in table})
+    print(f"\nPER MODEL\n{'model':<14} {header}")
+    for model in models:
+        print(line(model, summarise([row for (m, _), row in table.items() if m == model]), 14))
+    print(line("ALL", summarise(list(table.values())), 14))
+
+    hours = sorted({hour for _, hour in table})[-max_hours:]
+    print(f"\nPER MODEL PER HOUR (last {len(hours)} hours, UTC)\n{'model':<14} {'hour':<14} {header}")
+    for model in models:
+        for hour in hours:
+            if (model, hour) in table:
+                label = time.strftime("%m-%d %H:00", time.gmtime(hour * 3600))
+                print(line(f"{model:<14} {label}", summarise([table[(model, hour)]]), 29))
+
+    if error_classes:
+        print(f"\nERRORS BY CLASS\n{'model':<14} {'error':<28} {'count':>8}")
+        for (model, error_class), count in error_classes.most_common(20):
+            print(f"{model:<14} {error_class:<28} {count:>8,}")
+
+
+def analyse(paths, workers, report=True):
+    shards = [shard for path in paths for shard in find_shards(path, workers)]
+    total_bytes = sum(end - start for _, start, end in shards)
+
+    start = time.perf_counter()
+    if workers > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_shard, shards))
+    else:
+        results = [parse_shard(shard) for shard in shards]
+    table, error_classes, lines, bad_lines = merge(results)
+    elapsed = time.perf_counter() - start
+
+    if report:
+        print_report(table, error_classes)
+    print(f"\nScanned {total_bytes / 1e6:,.1f} MB ({lines:,} records, {bad_lines} unparseable) "
+          f"in {elapsed:.2f}s with {workers} worker(s): {total_bytes / 1e9 / elapsed:.3f} GB/s")
+    return elapsed
+
+
+def generate_demo_log(path, records):
+    """Synthetic mix of log_interaction and RequestLogger lines over the past day"""
+    rng = np.random.default_rng(42)
+    now = time.time()
+    models = np.array(["gpt-5-mini", "gpt-4o"])
+    with open(path, "w") as f:
+        for i in range(records):
+            model = models[int(rng.random() < 0.3)]
+            timestamp = now - 86400 + 86400 * i / records
+            if i % 5 == 0:
+                failed = rng.random() < 0.01
+                entry = {"timestamp": timestamp, "prompt": f"ticket {i}", "status": "error" if failed else "success",
+                         "model": model}
+                entry.update({"error_type": "RateLimitError"} if failed else {"request_id": f"chatcmpl-{i}",
+                                                                              "tokens": int(rng.integers(50, 2000))})
+            else:
+                failed = rng.random() < 0.02
+                prompt, completion = (0, 0) if failed else (int(rng.integers(20, 1500)), int(rng.integers(10, 600)))
+                entry = {"timestamp": timestamp, "event": "chat_completion",
+                         "status": "error: Request timed out." if failed else "success",
+                         "duration_ms": round(float(rng.lognormal(6.5 if model == "gpt-4o" else 6.0, 0.5)), 2),
+                         "model": str(model),
+                         "token_usage": {"prompt": prompt, "completion": completion, "total": prompt + completion}}
+                if failed:
+                    entry["error_class"] = "APITimeoutError"
+                elif i % 3 == 0:
+                    entry["ttft_ms"] = round(float(rng.lognormal(5.5, 0.4)), 2)
+            f.write(json.dumps(entry) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse JSONL request logs in parallel")
+    parser.add_argument("paths", nargs="*", help="Log files written by RequestLogger / log_interaction")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--demo", type=int, metavar="N", help="Generate an N-record synthetic log and analyse it")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths and not args.demo:
+        parser.print_help()
+        sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        if args.demo:
+            demo_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            demo_path = os.path.join(demo_dir, "demo_requests.log")
+            print(f"Generating {args.demo:,} synthetic records...")
+            generate_demo_log(demo_path, args.demo)
+            paths = [demo_path]
+
+        print("📈 LOG ANALYTICS")
+        print("="*60)
+        analyse(paths, args.workers)
+
+        if args.demo and args.workers > 1:
+            print("\nSingle-process baseline:", end="")
+            analyse(paths, 1, report=False)
+
+
+if __name__ == "__main__":
+    main()
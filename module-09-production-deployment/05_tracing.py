@@ -0,0 +1,413 @@
+"""
+05_tracing.py - Trace multi-step workflows: API calls, retries, tools and agent steps
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from openai import OpenAI
+
+client = OpenAI()
+
+# OTLP enums (opentelemetry/proto/trace/v1/trace.proto)
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+def new_request_id():
+    """Unique X-Client-Request-Id - unlike req_{int(time.time())}, never shared by two requests"""
+    return f"req_{uuid.uuid4().hex}"
+
+
+class Span:
+    """One timed operation; trace/span IDs follow the W3C trace-context format"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "events", "status", "status_message")
+
+    def __init__(self, name, kind, trace_id, parent_id, attributes):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.events = []
+        self.status = None
+        self.status_message = ""
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_exception(self, error):
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)})
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # int64 is a string in OTLP/JSON
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class OTLPJsonFileExporter:
+    """
+    Append finished traces to a file in OTLP/JSON, one export request per line.
+
+    This is the format the OpenTelemetry Collector's file exporter writes
+    and its otlpjsonfile receiver reads, so the file can be shipped to
+    Jaeger, Tempo or Honeycomb later without changing the code.
+    """
+
+    def __init__(self, path="traces.otlp.jsonl", service_name="openai-app"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def to_otlp(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{
+                "scope": {"name": "05_tracing"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": SPAN_KINDS[span.kind],
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": _otlp_attributes(span.attributes),
+                    "events": [{"timeUnixNano": str(ts), "name": name, "attributes": _otlp_attributes(attrs)}
+                               for ts, name, attrs in span.events],
+                    "status": {"code": span.status or STATUS_OK, "message": span.status_message},
+                } for span in spans]
+            }]
+        }]}
+
+    def export(self, spans):
+        line = json.dumps(self.to_otlp(spans)) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class Tracer:
+    """
+    Nested spans without passing a span object through every function.
+
+    The current span lives in a ContextVar, so `with tracer.span(...)`
+    becomes a child of whatever span is open in the same thread or asyncio
+    task. Worker threads do not inherit it - submit work with
+    `tracer.bind(func)` so it stays attached to the caller's span.
+    When a root span ends, its whole trace goes to the exporter in one write;
+    a child that outlives its root (e.g. a background task) is exported on
+    its own when it ends, so nothing is held after the trace is done.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self._current = contextvars.ContextVar("current_span", default=None)
+        self._traces = {}  # trace_id -> [open span count, finished spans or None once exported]
+        self._lock = threading.Lock()
+
+    @property
+    def current_span(self):
+        return self._current.get()
+
+    @contextmanager
+    def span(self, name, kind="internal", **attributes):
+        parent = self._current.get()
+        trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        span = Span(name, kind, trace_id, parent.span_id if parent else None, attributes)
+        with self._lock:
+            self._traces.setdefault(trace_id, [0, []])[0] += 1
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            self._current.reset(token)
+            self._finish(span)
+
+    def _finish(self, span):
+        with self._lock:
+            state = self._traces[span.trace_id]
+            state[0] -= 1
+            if state[1] is None:
+                spans = [span]  # The root was already exported: flush this straggler alone
+            else:
+                state[1].append(span)
+                if span.parent_id is not None:
+                    return
+                spans, state[1] = state[1], None
+            if not state[0]:
+                del self._traces[span.trace_id]
+        if self.exporter:
+            self.exporter.export(spans)
+
+    def trace(self, name=None, kind="internal", **attributes):
+        """Decorator: run the function inside a span"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name or func.__name__, kind, **attributes):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def bind(self, func):
+        """Carry the current span into a thread pool: pool.map(tracer.bind(work), items)"""
+        context = contextvars.copy_context()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return context.copy().run(func, *args, **kwargs)
+        return wrapper
+
+
+tracer = Tracer(OTLPJsonFileExporter())
+
+
+def tool_span(name, **arguments):
+    """Span for one tool execution; arguments are recorded as attributes"""
+    return tracer.span(f"tool {name}", **{"tool.name": name},
+                       **{f"tool.arg.{key}": value for key, value in arguments.items()})
+
+
+def traced_chat_completion(messages, model="gpt-5-mini", retry_policy=None, api_client=None, **kwargs):
+    """
+    Chat completion as a client span with one child span per attempt.
+
+    Retrying is left to `retry_policy` - module 4's RetryPolicy
+    (07_best_practices.py) or anything with the same call(func, **kwargs) -
+    so back-off, retry-after and the retry budget work exactly as untraced;
+    each attempt it makes becomes a span. SDK retries are disabled then, so
+    no retry hides inside one long attempt. Without a policy the request is
+    sent once and the SDK's own retries apply.
+
+    Every attempt gets its own X-Client-Request-Id, and OpenAI's
+    x-request-id is recorded next to it, so a slow or failed attempt can be
+    matched to server-side logs.
+    """
+    api = api_client or client
+    if retry_policy is not None:
+        api = api.with_options(max_retries=0)
+    with tracer.span(f"chat {model}", kind="client", **{"gen_ai.system": "openai",
+                                                         "gen_ai.request.model": model}) as span:
+        attempts = 0
+        failed_at = None
+
+        def attempt(**request):
+            nonlocal attempts, failed_at
+            attempts += 1
+            if failed_at is not None:
+                # The gap since the last failure is the back-off the policy chose
+                span.add_event("retry", **{"retry.attempt": attempts - 1,
+                                           "retry.delay_s": round((time.time_ns() - failed_at) / 1e9, 3)})
+            request_id = new_request_id()
+            headers = {**(request.pop("extra_headers", None) or {}), "X-Client-Request-Id": request_id}
+            try:
+                with tracer.span("attempt", kind="client", **{"retry.attempt": attempts,
+                                                               "openai.client_request_id": request_id}) as attempt_span:
+                    raw = api.chat.completions.with_raw_response.create(extra_headers=headers, **request)
+                    attempt_span.set_attribute("openai.request_id", raw.headers.get("x-request-id", ""))
+                    return raw.parse()
+            except Exception:
+                failed_at = time.time_ns()
+                raise
+
+        request = {"model": model, "messages": messages, **kwargs}
+        response = retry_policy.call(attempt, **request) if retry_policy else attempt(**request)
+
+        span.set_attribute("gen_ai.response.model", response.model)
+        span.set_attribute("gen_ai.usage.input_tokens", response.usage.prompt_tokens)
+        span.set_attribute("gen_ai.usage.output_tokens", response.usage.completion_tokens)
+        span.set_attribute("retry.attempts", attempts)
+        return response
+
+
+# --- Reading traces back ---
+
+def load_traces(path):
+    """Read an OTLP/JSON file back into {trace_id: [span dict, ...]}"""
+    traces = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for span in scope["spans"]:
+                        traces.setdefault(span["traceId"], []).append(span)
+    return traces
+
+
+def print_waterfall(spans, width=40):
+    """Indented timeline of one trace, plus where the wall time went (self time per span name)"""
+    start = min(int(span["startTimeUnixNano"]) for span in spans)
+    end = max(int(span["endTimeUnixNano"]) for span in spans)
+    total = max(1, end - start)
+    children = {}
+    for span in spans:
+        children.setdefault(span["parentSpanId"], []).append(span)
+    self_time = {}
+
+    def walk(span, depth):
+        span_start, span_end = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+        offset = (span_start - start) * width // total
+        length = max(1, (span_end - span_start) * width // total)
+        failed = " ❌" if span["status"]["code"] == STATUS_ERROR else ""
+        label = f"{'  ' * depth}{span['name']}"
+        print(f"{label:<36} {' ' * offset}{'█' * length:<{width - offset}} {(span_end - span_start) / 1e6:8.1f} ms{failed}")
+
+        kids = sorted(children.get(span["spanId"], []), key=lambda s: int(s["startTimeUnixNano"]))
+        # Self time = duration not covered by children (children may overlap when run in parallel)
+        covered, cursor = 0, span_start
+        for kid in kids:
+            kid_start, kid_end = int(kid["startTimeUnixNano"]), int(kid["endTimeUnixNano"])
+            covered += max(0, kid_end - max(cursor, kid_start))
+            cursor = max(cursor, kid_end)
+        self_time[span["name"]] = self_time.get(span["name"], 0) + (span_end - span_start) - covered
+        for kid in kids:
+            walk(kid, depth + 1)
+
+    for root in children.get("", []):
+        walk(root, 0)
+
+    print(f"\nWall time {total / 1e6:.1f} ms - self time by span:")
+    for name, ns in sorted(self_time.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {name:<30} {ns / 1e6:8.1f} ms")
+
+
+# --- Offline demo: the auto-researcher flow (projects/01-auto-researcher) with simulated calls ---
+
+class SimulatedTimeout(Exception):
+    """Stands in for APITimeoutError in the offline demo"""
+
+    retry_after = 0.05  # Seconds, as a server's retry-after would say
+
+
+class SimulatedRetryPolicy:
+    """
+    Stand-in for module 4's RetryPolicy so the demo runs offline (numbered
+    scripts cannot import each other). Pass the real one in production.
+    """
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+
+    def call(self, func, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except SimulatedTimeout as e:
+                if attempt == self.max_attempts:
+                    raise
+                time.sleep(e.retry_after)
+
+
+class SimulatedClient:
+    """Mimics client.with_options(...).chat.completions.with_raw_response.create with fixed latencies"""
+
+    def __init__(self, latencies, fail_first=()):
+        self.latencies = latencies
+        self.fail_first = set(fail_first)  # Models whose first call times out
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self._create)))
+
+    def with_options(self, **options):
+        return self
+
+    def _create(self, model, messages, extra_headers=None, **kwargs):
+        with self._lock:
+            fail = model in self.fail_first
+            self.fail_first.discard(model)
+        time.sleep(self.latencies[model] * random.uniform(0.8, 1.2))
+        if fail:
+            raise SimulatedTimeout(f"{model} timed out")
+        usage = SimpleNamespace(prompt_tokens=sum(len(m["content"]) for m in messages) // 4, completion_tokens=400)
+        response = SimpleNamespace(model=model, usage=usage)
+        return SimpleNamespace(headers={"x-request-id": f"req_{uuid.uuid4().hex[:24]}"}, parse=lambda: response)
+
+
+def simulate_auto_researcher(topic="Solid-state batteries in EVs"):
+    api = SimulatedClient({"gpt-4o": 0.12, "o1-mini": 0.30}, fail_first=("o1-mini",))
+    policy = SimulatedRetryPolicy()
+    chat = lambda model, content: traced_chat_completion(
+        [{"role": "user", "content": content}], model=model, retry_policy=policy, api_client=api)
+
+    @tracer.trace("agent.research_question")
+    def research(question):
+        with tool_span("web_search", query=question):
+            time.sleep(0.08)
+        return chat("o1-mini", question)
+
+    with tracer.span("agent.run", **{"agent.topic": topic}):
+        with tracer.span("agent.plan"):
+            chat("gpt-4o", f"Plan research for {topic}")
+            questions = [f"{topic}: question {i}" for i in range(1, 4)]
+        with tracer.span("agent.research", **{"agent.questions": len(questions)}):
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                list(pool.map(tracer.bind(research), questions))
+        with tracer.span("agent.synthesize"):
+            chat("gpt-4o", "Write the report")
+
+
+def benchmark_span_overhead(spans=100000):
+    """Cost of opening and closing a nested span, export excluded"""
+    bench = Tracer()
+    start = time.perf_counter()
+    with bench.span("root"):
+        for _ in range(spans):
+            with bench.span("child", kind="client", **{"retry.attempt": 1}):
+                pass
+    elapsed = time.perf_counter() - start
+    print(f"\nSpan overhead: {elapsed / spans * 1e6:.1f} µs per span ({spans:,} spans)")
+
+
+def main():
+    print("🧭 TRACING - offline auto-researcher run")
+    print("="*60)
+
+    path = tracer.exporter.path
+    if os.path.exists(path):
+        os.remove(path)
+    simulate_auto_researcher()
+
+    for trace_id, spans in load_traces(path).items():
+        print(f"Trace {trace_id} ({len(spans)} spans) -> {os.path.basename(path)}\n")
+        print_waterfall(spans)
+
+    benchmark_span_overhead()
+
+
+if __name__ == "__main__":
+    main()
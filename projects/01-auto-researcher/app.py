@@ -8,10 +8,15 @@ This script demonstrates an agentic workflow using:
 """
 
 import os
+import sys
 import time
 from typing import List
 from openai import OpenAI
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+
+# Shared helpers live one level up, in projects/structured_outputs.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from structured_outputs import parse_structured
 
 # Initialize client
 client = OpenAI()
@@ -20,12 +25,14 @@ client = OpenAI()
 
 class ResearchPlan(BaseModel):
     """Structure for the initial research plan"""
+    model_config = ConfigDict(extra="forbid")
     topic: str
     sub_questions: List[str] = Field(description="List of 3-5 distinct sub-questions to research")
     summary_goal: str = Field(description="The goal of the final summary")
 
 class SearchResult(BaseModel):
     """Structure for a single research finding"""
+    model_config = ConfigDict(extra="forbid")
     question: str
     answer: str
     key_points: List[str]
@@ -36,16 +43,15 @@ def create_plan(topic: str) -> ResearchPlan:
     """Step 1: Create a research plan using GPT-4o"""
     print(f"\n📋 Planning research for: '{topic}'...")
     
-    completion = client.beta.chat.completions.parse(
+    plan = parse_structured(
+        client,
+        ResearchPlan,
         model="gpt-4o-2024-08-06",  # Use a structured-output capable model
         messages=[
             {"role": "system", "content": "You are a senior research lead. Break down the user's topic into 3 distinct, investigatable sub-questions."},
             {"role": "user", "content": f"Research topic: {topic}"}
-        ],
-        response_format=ResearchPlan
+        ]
     )
-    
-    plan = completion.choices[0].message.parsed
     print(f"✅ Plan created with {len(plan.sub_questions)} sub-questions.")
     return plan
 
@@ -6,12 +6,17 @@ It takes an image (URL or local path) and generates structured product data.
 """
 
 import os
+import sys
 import base64
 import requests
 from openai import OpenAI
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List
 
+# Shared helpers live one level up, in projects/structured_outputs.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from structured_outputs import parse_structured
+
 # Initialize client
 client = OpenAI()
 
@@ -19,6 +24,7 @@ client = OpenAI()
 
 class ProductAnalysis(BaseModel):
     """Structured output for product analysis"""
+    model_config = ConfigDict(extra="forbid")
     title: str = Field(description="SEO optimized product title (50-60 chars)")
     description: str = Field(description="Engaging marketing description (2-3 sentences)")
     features: List[str] = Field(description="List of 3 key visual features")
@@ -48,7 +54,9 @@ def analyze_image(image_input: str, is_url: bool = True) -> ProductAnalysis:
         image_content = {"url": f"data:image/jpeg;base64,{base64_image}"}
 
     try:
-        completion = client.beta.chat.completions.parse(
+        return parse_structured(
+            client,
+            ProductAnalysis,
             model="gpt-4o-2024-08-06",
             messages=[
                 {
@@ -62,10 +70,8 @@ def analyze_image(image_input: str, is_url: bool = True) -> ProductAnalysis:
                         {"type": "image_url", "image_url": image_content}
                     ]
                 }
-            ],
-            response_format=ProductAnalysis
+            ]
         )
-        return completion.choices[0].message.parsed
     except Exception as e:
         print(f"Error calling OpenAI API: {e}")
         return None
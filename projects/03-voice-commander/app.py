@@ -7,8 +7,17 @@ Demonstrates Speech-to-Text (Whisper), Text-to-Speech (TTS), and Function Callin
 
 import os
 import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unicodedata
+import sys
 import subprocess
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from pathlib import Path
 from typing import Optional
 
 # Audio libraries
@@ -19,17 +28,30 @@ import scipy.io.wavfile as wav
 
 from openai import OpenAI
 
+# Shared helpers live one level up, in projects/tool_schemas.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tool_schemas import function_schema
+
 client = OpenAI()
 
 # --- Config ---
 SAMPLE_RATE = 44100  # Hertz
 RECORDING_FILE = "input_command.wav"
 RESPONSE_FILE = "response.mp3"
+TTS_MODEL = "tts-1"
+TTS_VOICE = "onyx"
+TTS_CACHE_DIR = ".tts_cache"
+TTS_CACHE_MAX_BYTES = 50 * 1024 * 1024  # 50 MB
 
 # --- System Functions ---
 
 def open_application(app_name: str):
-    """Opens a system application (Windows specific example)"""
+    """Opens a desktop application on the user's computer
+
+    Args:
+        app_name: The name of the application
+    """
+    # Windows specific example
     print(f"🖥️  System executing: Open {app_name}")
     try:
         if "notepad" in app_name.lower():
@@ -47,34 +69,156 @@ def open_application(app_name: str):
         return f"Failed to open {app_name}: {str(e)}"
 
 def get_system_time():
-    """Returns current system time"""
+    """Get the current time"""
     return time.strftime("%I:%M %p")
 
-# Tool definitions for GPT
-TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "open_application",
-            "description": "Opens a desktop application on the user's computer",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "app_name": {"type": "string", "description": "The name of the application"}
-                },
-                "required": ["app_name"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_system_time",
-            "description": "Get the current time",
-            "parameters": {"type": "object", "properties": {}}
+AVAILABLE_FUNCTIONS = {
+    "open_application": open_application,
+    "get_system_time": get_system_time,
+}
+
+# Tool definitions for GPT - generated once at startup from the functions above
+TOOLS = [function_schema(func) for func in AVAILABLE_FUNCTIONS.values()]
+
+TOOL_TIMEOUT = 5.0  # seconds per tool call
+tool_pool = ThreadPoolExecutor(max_workers=4)
+
+def timed_call(function, args):
+    """Run a tool and measure how long it took on its worker thread"""
+    start = time.perf_counter()
+    result = function(**args)
+    return result, (time.perf_counter() - start) * 1000
+
+def execute_tool_calls(tool_calls):
+    """
+    Run every tool call from one model turn in parallel.
+    The turn costs as long as the slowest tool, not the sum of them.
+    Results are returned in the same order the model asked for them.
+    """
+    futures = []
+    for tool_call in tool_calls:
+        function_name = tool_call.function.name
+        function = AVAILABLE_FUNCTIONS.get(function_name)
+        if function is None:
+            futures.append(f"Unknown tool: {function_name}")
+            continue
+        # One malformed call must not cost the other tools their answers
+        try:
+            args = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            futures.append(f"{function_name} failed: invalid arguments ({e})")
+            continue
+        futures.append(tool_pool.submit(timed_call, function, args))
+
+    deadline = time.perf_counter() + TOOL_TIMEOUT
+    tool_messages = []
+    for tool_call, future in zip(tool_calls, futures):
+        function_name = tool_call.function.name
+        elapsed_ms = None
+        try:
+            if isinstance(future, str):
+                function_response = future  # Rejected before it could run
+            else:
+                function_response, elapsed_ms = future.result(timeout=max(0, deadline - time.perf_counter()))
+        except FutureTimeoutError:
+            function_response = f"{function_name} timed out."
+        except Exception as e:
+            function_response = f"{function_name} failed: {str(e)}"
+
+        if elapsed_ms is not None:
+            print(f"⏱️  {function_name}: {elapsed_ms:.0f}ms")
+
+        tool_messages.append({
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "name": function_name,
+            "content": function_response,
+        })
+    return tool_messages
+
+# --- Speech Cache ---
+
+class SpeechCache:
+    """
+    On-disk LRU cache of synthesised replies.
+    Confirmations like "Opened Notepad successfully." repeat constantly,
+    so we key audio by (normalised text, voice, model, format) and only
+    call the TTS API the first time a phrase is spoken.
+    Same design as TTSAudioCache in module 3: bounded by total bytes,
+    recency kept in file mtimes, safe to share between threads.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        # Oldest first; mtime is refreshed on every hit so order survives restarts
+        files = [p for p in self.cache_dir.iterdir()
+                 if p.is_file() and not p.name.startswith(".") and p.suffix != ".tmp"]
+        files.sort(key=lambda p: p.stat().st_mtime)
+        self.entries = OrderedDict((p, p.stat().st_size) for p in files)
+        self.total_bytes = sum(self.entries.values())
+
+    def _path_for(self, text, voice, model, fmt):
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        key = hashlib.sha256(json.dumps([normalized, voice, model, fmt]).encode()).hexdigest()
+        return self.cache_dir / f"{key}.{fmt}"
+
+    def synthesize(self, text, voice=TTS_VOICE, model=TTS_MODEL, fmt="mp3"):
+        """Return a path to the spoken audio, hitting the API only on a miss"""
+        path = self._path_for(text, voice, model, fmt)
+
+        with self._lock:
+            cached = path in self.entries and path.exists()
+            if cached:
+                self.hits += 1
+                self.entries.move_to_end(path)
+            else:
+                self.entries.pop(path, None)
+                self.misses += 1
+        if cached:
+            os.utime(path)
+            return path
+
+        response = client.audio.speech.create(model=model, voice=voice, input=text, response_format=fmt)
+        # Unique temp file per writer, so concurrent misses never share a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.total_bytes -= self.entries.pop(path, 0)
+            self.entries[path] = len(response.content)
+            self.total_bytes += len(response.content)
+
+            # Evict least recently used audio until we are back under budget
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_path, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                self.evictions += 1
+                old_path.unlink(missing_ok=True)
+
+        return path
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 2) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
         }
-    }
-]
+
+
+speech_cache = SpeechCache()
 
 # --- Audio Functions ---
 
@@ -94,14 +238,12 @@ def speak_response(text):
     """Generate and play speech"""
     print(f"🗣️  Speaking: {text}")
     
-    response = client.audio.speech.create(
-        model="tts-1",
-        voice="onyx",
-        input=text
-    )
+    # Repeated phrases are played straight from the cache
+    audio_path = speech_cache.synthesize(text)
+    print(f"🔁 TTS cache: {speech_cache.stats()}")
     
     # Save to file
-    response.stream_to_file(RESPONSE_FILE)
+    shutil.copyfile(audio_path, RESPONSE_FILE)
     
     # Play file (Windows specific)
     os.system(f"start {RESPONSE_FILE}")
@@ -138,27 +280,10 @@ def process_command():
     final_response_text = ""
     
     if tool_calls:
-        # 3. Execute Tool
+        # 3. Execute Tools (in parallel)
         messages.append(response_message)
+        messages.extend(execute_tool_calls(tool_calls))
         
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments)
-            
-            function_response = ""
-            
-            if function_name == "open_application":
-                function_response = open_application(function_args.get("app_name"))
-            elif function_name == "get_system_time":
-                function_response = get_system_time()
-                
-            messages.append({
-                "tool_call_id": tool_call.id,
-                "role": "tool",
-                "name": function_name,
-                "content": function_response,
-            })
-            
         # 4. Get Final Answer
         second_response = client.chat.completions.create(
             model="gpt-4o",
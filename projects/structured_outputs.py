@@ -0,0 +1,30 @@
+"""
+Structured Output helpers shared by the projects.
+
+Each app adds this folder to sys.path and imports from here, so the cached
+response_format and the validation path are defined once.
+"""
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def response_format_for(model_cls):
+    """Build the json_schema response_format once per model class instead of on every request"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model_cls.__name__,
+            "schema": model_cls.model_json_schema(),   # Flat models with extra="forbid" are already strict-mode valid
+            "strict": True
+        }
+    }
+
+
+def parse_structured(client, model_cls, **request):
+    """Request a structured completion and validate it with the model's compiled Pydantic validator"""
+    completion = client.chat.completions.create(response_format=response_format_for(model_cls), **request)
+    message = completion.choices[0].message
+    if message.refusal:
+        raise ValueError(f"Model refused: {message.refusal}")
+    return model_cls.model_validate_json(message.content)
@@ -0,0 +1,97 @@
+"""
+Tool schema generation shared by the projects.
+
+Builds a function-calling tool definition from a function's signature and
+Google-style docstring: type hints (including Literal, List and Optional)
+become JSON schema, and only the "Args:" section feeds the per-argument
+descriptions. Same rules as function_schema() in
+module-03-core-concepts/10_function_calling.py.
+"""
+
+import inspect
+import typing
+from functools import lru_cache
+from typing import Literal
+
+
+_PYTHON_TO_JSON_TYPE = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+
+def _annotation_to_schema(annotation):
+    """Translate a type hint into a JSON schema fragment"""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is Literal:
+        return {"type": _PYTHON_TO_JSON_TYPE.get(type(args[0]), "string"), "enum": list(args)}
+    if origin is list:
+        return {"type": "array", "items": _annotation_to_schema(args[0]) if args else {}}
+    if origin is typing.Union:
+        non_null = [arg for arg in args if arg is not type(None)]
+        return _annotation_to_schema(non_null[0]) if non_null else {"type": "null"}
+    return {"type": _PYTHON_TO_JSON_TYPE.get(annotation, "string")}
+
+
+def _parse_docstring(doc):
+    """Split a Google-style docstring into a summary and per-argument descriptions"""
+    summary_lines = []
+    arg_docs = {}
+    current_arg = None
+    in_args = False
+    summary_done = False
+
+    for line in inspect.cleandoc(doc or "").splitlines():
+        stripped = line.strip()
+        if stripped in ("Args:", "Arguments:", "Parameters:"):
+            in_args = True
+        elif in_args and stripped.endswith(":") and not line.startswith(" "):
+            in_args = False  # Returns:, Raises:, ...
+        elif in_args and ":" in stripped and line.startswith("    ") and not line.startswith("        "):
+            current_arg, description = stripped.split(":", 1)
+            arg_docs[current_arg.split("(")[0].strip()] = description.strip()
+        elif in_args and current_arg and stripped:
+            arg_docs[current_arg.split("(")[0].strip()] += " " + stripped
+        elif not in_args and not summary_done:
+            if stripped:
+                summary_lines.append(stripped)
+            elif summary_lines:
+                summary_done = True  # Summary is the first paragraph
+
+    return " ".join(summary_lines), arg_docs
+
+
+@lru_cache(maxsize=None)
+def function_schema(func):
+    """Build (once per function) a tool schema from its signature and docstring"""
+    description, arg_docs = _parse_docstring(func.__doc__)
+    hints = typing.get_type_hints(func)
+    properties = {}
+    required = []
+
+    for name, param in inspect.signature(func).parameters.items():
+        prop = _annotation_to_schema(hints.get(name, str))
+        if name in arg_docs:
+            prop["description"] = arg_docs[name]
+        properties[name] = prop
+        if param.default is inspect.Parameter.empty:
+            required.append(name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": required,
+            },
+        },
+    }